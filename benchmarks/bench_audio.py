@@ -0,0 +1,182 @@
+"""Time the audio pipeline on synthetic datasets.
+
+Usage: python -m benchmarks.bench_audio [--plays 10000 1000000] [-o FILE]
+
+Results are written as JSON so runs can be compared."""
+from argparse import ArgumentParser
+from json import dump as dump_json
+from os.path import join
+from platform import python_version
+from shutil import copyfile, rmtree
+from sqlite3 import sqlite_version
+from tempfile import mkdtemp
+from time import perf_counter
+from jellyfinstats.audio import (
+    AudioReportSet,
+    fix_audio_report_library,
+    generate_audio_report,
+    generate_audio_reports,
+    generate_audio_summary,
+    prepare_audio_map,
+)
+from jellyfinstats.cache import IdRelativeCache
+from jellyfinstats.columnar import AVAILABLE as COLUMNAR_AVAILABLE
+from jellyfinstats.config import Config
+from jellyfinstats.csv import CSVFile
+from jellyfinstats.db import LibraryDb, PlaybackReportingDb
+from jellyfinstats.utils import (
+    YearMonth,
+    gen_month_range,
+    gen_year_range,
+    parse_datetime,
+)
+from .bench_csv import gen_rows
+from .dataset import Dataset
+
+
+class Timer:
+    def __init__(self, results: dict, name: str, rows: int = None):
+        self.results = results
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, tp, val, trace):
+        if tp is not None:
+            return
+        t = perf_counter() - self.start
+        re = {'seconds': round(t, 6)}
+        if self.rows is not None:
+            re['rows'] = self.rows
+            re['rows_per_second'] = round(self.rows / t, 1) if t else None
+        self.results[self.name] = re
+        print(f'{self.name}: {t:.3f}s')
+
+
+def user_months(minTime, maxTime):
+    month = YearMonth(minTime.year, minTime.month)
+    maxMonth = YearMonth(maxTime.year, maxTime.month)
+    while month <= maxMonth:
+        yield month
+        month += 1
+
+
+def run(ds: Dataset) -> dict:
+    results = {}
+    cfg = Config(ds.config)
+    plays = ds.plays
+    with PlaybackReportingDb(ds.playback_reporting_db) as pdb:
+        with LibraryDb(ds.library_db) as ldb:
+            with IdRelativeCache(ds.output_dir) as icache:
+                with Timer(results, 'prepare_audio_map', plays):
+                    itemMap, idMap, albumMap = prepare_audio_map(
+                        pdb, ldb, icache, cfg)
+        users = pdb.get_users('Audio')
+        audioPlays = sum(1 for _ in pdb.iter_activitys(itemType='Audio'))
+        output = join(ds.output_dir, 'audio')
+        with Timer(results, 'generate_audio_report_all', audioPlays):
+            for u in users:
+                generate_audio_report(pdb, itemMap, idMap, albumMap,
+                                      join(output, u['UserId']), u['UserId'])
+        with Timer(results, 'generate_audio_report_all_pipelined', audioPlays):  # noqa: E501
+            for u in users:
+                generate_audio_report(pdb, itemMap, idMap, albumMap,
+                                      join(ds.output_dir, 'audio_pipelined', u['UserId']),  # noqa: E501
+                                      u['UserId'], pipelined=True)
+        if COLUMNAR_AVAILABLE:
+            with Timer(results, 'generate_audio_report_all_numpy', audioPlays):  # noqa: E501
+                for u in users:
+                    generate_audio_report(pdb, itemMap, idMap, albumMap,
+                                          join(ds.output_dir, 'audio_numpy', u['UserId']),  # noqa: E501
+                                          u['UserId'], columnar=True)
+        with Timer(results, 'generate_audio_report_year', audioPlays):
+            for u in users:
+                minTime = parse_datetime(u['MinDate'])
+                maxTime = parse_datetime(u['MaxDate'])
+                for year in range(minTime.year, maxTime.year + 1):
+                    time = gen_year_range(year)
+                    generate_audio_report(pdb, itemMap, idMap, albumMap, join(output, u['UserId'], str(year)), u['UserId'], time[0], time[1])  # noqa: E501
+        with Timer(results, 'generate_audio_report_month', audioPlays):
+            for u in users:
+                minTime = parse_datetime(u['MinDate'])
+                maxTime = parse_datetime(u['MaxDate'])
+                for month in user_months(minTime, maxTime):
+                    time = gen_month_range(month)
+                    generate_audio_report(pdb, itemMap, idMap, albumMap, join(output, u['UserId'], str(month.year), str(month.month).rjust(2, '0')), u['UserId'], time[0], time[1])  # noqa: E501
+        with Timer(results, 'generate_audio_summary_month', audioPlays):
+            for u in users:
+                minTime = parse_datetime(u['MinDate'])
+                maxTime = parse_datetime(u['MaxDate'])
+                for month in user_months(minTime, maxTime):
+                    time = gen_month_range(month)
+                    generate_audio_summary(pdb, itemMap, idMap, albumMap, join(ds.output_dir, 'summary', u['UserId'], str(month.year), str(month.month).rjust(2, '0')), u['UserId'], time[0], time[1])  # noqa: E501
+        with Timer(results, 'generate_audio_reports_full', audioPlays):
+            reports = AudioReportSet()
+            for u in users:
+                reports.add_user(u['UserId'], join(ds.output_dir, 'full', u['UserId']))  # noqa: E501
+            generate_audio_reports(pdb, itemMap, idMap, albumMap, reports)
+        if COLUMNAR_AVAILABLE:
+            with Timer(results, 'generate_audio_reports_full_numpy', audioPlays):  # noqa: E501
+                reports = AudioReportSet(columnar=True)
+                for u in users:
+                    reports.add_user(u['UserId'], join(ds.output_dir, 'full_numpy', u['UserId']))  # noqa: E501
+                generate_audio_reports(pdb, itemMap, idMap, albumMap, reports)  # noqa: E501
+    fixDb = join(ds.path, 'playback_reporting_fix.db')
+    copyfile(ds.playback_reporting_db, fixDb)
+    with PlaybackReportingDb(fixDb) as pdb:
+        with Timer(results, 'fix_audio_report_library_dry_run', audioPlays):
+            fix_audio_report_library(pdb, join(ds.output_dir, 'fix.csv'))
+        # Changes the copy of the database.
+        with Timer(results, 'fix_audio_report_library', audioPlays):
+            fix_audio_report_library(pdb)
+    # Rows are generated while writing, so their time is included.
+    with Timer(results, 'csv_write_rows', plays):
+        with CSVFile(join(ds.output_dir, 'bench.csv')) as f:
+            f.write_rows(gen_rows(plays))
+    return results
+
+
+def main():
+    p = ArgumentParser(prog='bench_audio')
+    p.add_argument('-p', '--plays', type=int, nargs='+', default=[10_000],
+                   help='Dataset sizes (number of plays).')
+    p.add_argument('-u', '--users', type=int, default=5)
+    p.add_argument('-t', '--tracks', type=int,
+                   help='Number of tracks. Default: plays / 20')
+    p.add_argument('--missing', type=float, default=0.01,
+                   help='Fraction of plays of deleted items.')
+    p.add_argument('--remapped', type=float, default=0.02,
+                   help='Fraction of plays of re-added items.')
+    p.add_argument('-d', '--dir', help='Work directory. Default: temporary directory.')  # noqa: E501
+    p.add_argument('-o', '--output', default='bench_results.json',
+                   help='JSON result file.')
+    arg = p.parse_args()
+    base = arg.dir if arg.dir else mkdtemp(prefix='jellyfinstats-bench-')
+    data = {'python': python_version(), 'sqlite': sqlite_version,
+            'datasets': []}
+    try:
+        for plays in arg.plays:
+            print(f'Dataset: {plays} plays')
+            ds = Dataset(join(base, str(plays)), plays, arg.tracks, arg.users,
+                         arg.missing, arg.remapped)
+            generate = {}
+            with Timer(generate, 'generate_dataset', plays):
+                ds.generate()
+            results = run(ds)
+            data['datasets'].append({
+                'plays': plays, 'tracks': ds.tracks, 'users': ds.users,
+                'missing': ds.missing, 'remapped': ds.remapped,
+                'generate_dataset': generate['generate_dataset'],
+                'stages': results})
+    finally:
+        if not arg.dir:
+            rmtree(base, ignore_errors=True)
+    with open(arg.output, 'w', encoding='UTF-8') as f:
+        dump_json(data, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Compare CSVFile.write per row with CSVFile.write_rows on a synthetic
+history.csv and time reading it back.
+
+Usage: python -m benchmarks.bench_csv [rows]
+
+Rows are generated anew for every pass, so memory stays flat at any
+size. The time of generating them is printed separately and included in
+the write times."""
+from enum import Enum
+from hashlib import sha256
+from os import close, remove
+from sys import argv
+from tempfile import mkstemp
+from time import perf_counter
+from jellyfinstats.csv import CSVFile, OpenMode, UTF8_BOM
+
+
+def legacy_escape(s: str) -> str:
+    if s.find('\r\n') > -1 or s.find(',') > -1 or s.find('"') > -1:
+        return '"' + s.replace('"', '""') + '"'
+    else:
+        return s
+
+
+def legacy_write(f, *k):
+    """writeField before write_rows was added."""
+    a = False
+    for i in k:
+        if a:
+            f.write(b',')
+        else:
+            a = True
+        if i is None:
+            i = ''
+        elif isinstance(i, bool):
+            i = str(int(i))
+        elif isinstance(i, Enum):
+            i = str(i.value)
+        elif not isinstance(i, str):
+            i = str(i)
+        f.write(legacy_escape(i).encode())
+    f.write(b'\r\n')
+
+
+def gen_rows(count: int):
+    for i in range(count):
+        yield (i + 1, '2024-05-15', '10:20:30.123456', f'Track, "{i % 977}"', 'Artist1|Artist2', f'Album {i % 101}', 'Artist1', '03:25', 205.1234567, '0123456789abcdef0123456789abcdef', '0123456789abcdef0123456789abcdef', '02:10', 130, f'Artist1 - Track, "{i % 977}" (Album {i % 101})', 'Finamp', 'Pixel', 'DirectPlay', 1)  # noqa: E501
+
+
+def file_hash(path: str) -> bytes:
+    h = sha256()
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(1 << 20)
+            if not data:
+                return h.digest()
+            h.update(data)
+
+
+def main():
+    count = int(argv[1]) if len(argv) > 1 else 1_000_000
+    fd, path = mkstemp(suffix='.csv')
+    close(fd)
+    try:
+        t = perf_counter()
+        for _row in gen_rows(count):
+            pass
+        generate = perf_counter() - t
+        t = perf_counter()
+        with open(path, 'wb') as f:
+            f.write(UTF8_BOM)
+            for row in gen_rows(count):
+                legacy_write(f, *row)
+        legacy = perf_counter() - t
+        expected = file_hash(path)
+        t = perf_counter()
+        with CSVFile(path) as f:
+            for row in gen_rows(count):
+                f.write(*row)
+        single = perf_counter() - t
+        t = perf_counter()
+        with CSVFile(path) as f:
+            f.write_rows(gen_rows(count))
+        batched = perf_counter() - t
+        data = file_hash(path)
+        t = perf_counter()
+        with CSVFile(path, OpenMode.Read) as f:
+            readCount = sum(1 for _ in f)
+        read = perf_counter() - t
+    finally:
+        remove(path)
+    if data != expected:
+        raise AssertionError('write_rows output differs from legacy writer')
+    if readCount != count:
+        raise AssertionError(f'read {readCount} rows, expected {count}')
+    print(f'rows: {count}')
+    print(f'generating rows:   {generate:.3f}s (included below)')
+    print(f'legacy writeField: {legacy:.3f}s ({count / legacy:,.0f} rows/s)')  # noqa: E501
+    print(f'CSVFile.write:     {single:.3f}s ({count / single:,.0f} rows/s)')  # noqa: E501
+    print(f'CSVFile.write_rows: {batched:.3f}s ({count / batched:,.0f} rows/s)')  # noqa: E501
+    print(f'speedup: {legacy / batched:.2f}x')
+    print(f'CSVFile read:      {read:.3f}s ({count / read:,.0f} rows/s)')
+
+
+if __name__ == '__main__':
+    main()
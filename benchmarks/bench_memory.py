@@ -0,0 +1,57 @@
+"""Compare the memory used by preloaded audio items as ``SELECT *`` dicts
+and as LibraryItem records.
+
+Usage: python -m benchmarks.bench_memory [tracks]"""
+import sqlite3
+from sys import argv
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from tracemalloc import get_traced_memory, start, stop
+from jellyfinstats.db import AUDIO_TYPE, LibraryDb
+from .dataset import Dataset
+
+
+def legacy_load(path: str):
+    """LibraryDb.preload_audios before items were narrowed."""
+    db = sqlite3.connect(path)
+    cur = db.execute("SELECT * FROM TypedBaseItems WHERE type = ?;", [AUDIO_TYPE])  # noqa: E501
+    cur.row_factory = sqlite3.Row
+    re = {}
+    for i in cur:
+        item = dict(i)
+        re[item['PresentationUniqueKey']] = item
+    db.close()
+    return re
+
+
+def narrow_load(path: str):
+    with LibraryDb(path, True) as ldb:
+        ldb.preload_audios()
+        return ldb.get_audios()
+
+
+def measure(f, path: str):
+    start()
+    t = perf_counter()
+    re = f(path)
+    t = perf_counter() - t
+    current, peak = get_traced_memory()
+    stop()
+    del re
+    return t, current, peak
+
+
+def main():
+    tracks = int(argv[1]) if len(argv) > 1 else 100_000
+    with TemporaryDirectory() as d:
+        ds = Dataset(d, tracks * 2, tracks)
+        ds._generate_library()
+        print(f'tracks: {tracks}')
+        for name, f in (('SELECT * dicts', legacy_load),
+                        ('LibraryItem', narrow_load)):
+            t, current, peak = measure(f, ds.library_db)
+            print(f'{name}: {t:.3f}s, retained {current / 2 ** 20:.1f} MiB, peak {peak / 2 ** 20:.1f} MiB')  # noqa: E501
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Measure the startup of quick CLI invocations with ``-X importtime``.
+
+Usage: python -m benchmarks.bench_startup [runs]
+
+Every case is checked against an import time budget and a list of modules
+it must not import. Exits with status 1 if a budget is exceeded."""
+from re import compile
+from subprocess import run
+from sys import argv, executable, exit
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from .dataset import Dataset
+
+
+IMPORTTIME_PATTERN = compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$')  # noqa: E501
+# Modules only needed by some actions.
+HEAVY_MODULES = ('numpy', 'http.server', 'concurrent.futures.process',
+                 'jellyfinstats.audio', 'jellyfinstats.serve')
+# (name, arguments, import time budget in ms, forbidden modules)
+CASES = (
+    ('help', ['--help'], 100, HEAVY_MODULES),
+    ('no action', [], 100, HEAVY_MODULES),
+    ('stats', ['stats', '-a', 'item_type'], 120, HEAVY_MODULES),
+)
+
+
+def import_times(args, runs: int):
+    """Total import time in ms of the fastest of ``runs`` runs of
+    ``python args`` and the modules it imported with their cumulative time
+    in ms."""
+    best = None
+    for _ in range(runs):
+        p = run([executable, '-X', 'importtime'] + args, capture_output=True,
+                text=True)
+        total = 0
+        modules = {}
+        for line in p.stderr.splitlines():
+            m = IMPORTTIME_PATTERN.match(line)
+            if m is None:
+                continue
+            total += int(m[1])
+            modules[m[4]] = int(m[2]) / 1000
+        if best is None or total < best[0]:
+            best = (total, modules)
+    return best[0] / 1000, best[1]
+
+
+def wall_time(args, runs: int) -> float:
+    best = None
+    for _ in range(runs):
+        t = perf_counter()
+        run([executable, '-m', 'jellyfinstats'] + args, capture_output=True)
+        t = perf_counter() - t
+        best = t if best is None or t < best else best
+    return best * 1000
+
+
+def main():
+    runs = int(argv[1]) if len(argv) > 1 else 5
+    ok = True
+    with TemporaryDirectory() as d:
+        ds = Dataset(d, 1000).generate()
+        total, _modules = import_times(['-c', 'pass'], runs)
+        print(f'python: imports {total:.1f} ms')
+        for name, args, budget, forbidden in CASES:
+            args = ['-c', ds.config] + args
+            total, modules = import_times(['-m', 'jellyfinstats'] + args, runs)
+            wall = wall_time(args, runs)
+            heavy = [m for m in forbidden if m in modules]
+            status = 'ok'
+            if total > budget or heavy:
+                status = 'FAIL'
+                ok = False
+            print(f'{name}: wall {wall:.1f} ms, imports {total:.1f} ms (budget {budget} ms) {status}')  # noqa: E501
+            for m in heavy:
+                print(f'  imports {m} ({modules[m]:.1f} ms)')
+    if not ok:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
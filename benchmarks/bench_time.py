@@ -0,0 +1,68 @@
+"""Compare the regex based DateCreated parsing and strftime formatting
+with parse_time_us/format_local_time.
+
+Usage: python -m benchmarks.bench_time [count]"""
+from datetime import datetime, timedelta
+from random import Random
+from sys import argv
+from time import perf_counter
+from jellyfinstats.utils import (
+    format_local_time,
+    parse_datetime,
+    parse_time,
+    parse_time_us,
+)
+
+
+def gen_times(count: int):
+    r = Random(1)
+    time = datetime(2019, 1, 1)
+    re = []
+    for _ in range(count):
+        time += timedelta(seconds=r.randint(1, 600),
+                          microseconds=r.randrange(1_000_000))
+        re.append(time.strftime('%Y-%m-%d %H:%M:%S.%f') + str(r.randrange(10)))  # noqa: E501
+    return re
+
+
+def legacy(times):
+    re = []
+    for t in times:
+        created = datetime.fromtimestamp(parse_datetime(t).timestamp(), None)
+        re.append((created.strftime("%Y-%m-%d"),
+                   created.strftime("%H:%M:%S.%f")))
+    return re
+
+
+def fast(times):
+    return [format_local_time(parse_time_us(t)) for t in times]
+
+
+def main():
+    count = int(argv[1]) if len(argv) > 1 else 1_000_000
+    times = gen_times(count)
+    t = perf_counter()
+    for i in times:
+        parse_datetime(i).timestamp()
+    legacyParse = perf_counter() - t
+    t = perf_counter()
+    for i in times:
+        parse_time(i)
+    fastParse = perf_counter() - t
+    t = perf_counter()
+    expected = legacy(times)
+    legacyAll = perf_counter() - t
+    t = perf_counter()
+    data = fast(times)
+    fastAll = perf_counter() - t
+    if data != expected:
+        raise AssertionError('format_local_time output differs')
+    print(f'rows: {count}')
+    print(f'parse_datetime().timestamp(): {legacyParse:.3f}s')
+    print(f'parse_time:                   {fastParse:.3f}s ({legacyParse / fastParse:.2f}x)')  # noqa: E501
+    print(f'parse + fromtimestamp + strftime: {legacyAll:.3f}s')
+    print(f'parse_time_us + format_local_time: {fastAll:.3f}s ({legacyAll / fastAll:.2f}x)')  # noqa: E501
+
+
+if __name__ == '__main__':
+    main()
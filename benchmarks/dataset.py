@@ -0,0 +1,168 @@
+"""Generate synthetic Jellyfin databases for benchmarks.
+
+Usage: python -m benchmarks.dataset OUTPUT_DIR [plays]"""
+import sqlite3
+from datetime import datetime, timedelta
+from json import dumps as dump_json
+from os import makedirs, remove
+from os.path import exists, join
+from random import Random
+from sys import argv
+from yaml import dump as dumpyaml
+from jellyfinstats.db import AUDIO_TYPE, MUSIC_ALBUM_TYPE
+
+
+EPISODE_TYPE = 'Episode'
+CLIENTS = (('Jellyfin Web', 'Firefox'), ('Jellyfin Web', 'Chrome'),
+           ('Finamp', 'Pixel 7'), ('Finamp', 'iPhone'),
+           ('Jellyfin Media Player', 'Desktop'))
+PLAYBACK_METHODS = ('DirectPlay', 'DirectStream', 'Transcode')
+
+
+def format_uid(uid: str) -> str:
+    t = uid.upper()
+    return f"{t[:8]}-{t[8:12]}-{t[12:16]}-{t[16:20]}-{t[20:]}"
+
+
+class Dataset:
+    """Synthetic ``playback_reporting.db``, ``library.db`` and
+    ``jellyfin.db``.
+
+    ``missing`` is the fraction of audio plays whose item is gone from the
+    library and cannot be found again (recorded as ``no_track`` in the id
+    cache), ``remapped`` the fraction whose item was re-added under a new
+    id and is found again by name and album."""
+    def __init__(self, path: str, plays: int = 10_000, tracks: int = None,
+                 users: int = 5, missing: float = 0.01,
+                 remapped: float = 0.02, other: float = 0.05,
+                 seed: int = 1):
+        self.path = path
+        self.plays = plays
+        self.tracks = tracks if tracks else max(100, min(300_000, plays // 20))  # noqa: E501
+        self.users = users
+        self.missing = missing
+        self.remapped = remapped
+        self.other = other
+        self._rand = Random(seed)
+
+    @property
+    def playback_reporting_db(self) -> str:
+        return join(self.path, 'playback_reporting.db')
+
+    @property
+    def library_db(self) -> str:
+        return join(self.path, 'library.db')
+
+    @property
+    def jellyfin_db(self) -> str:
+        return join(self.path, 'jellyfin.db')
+
+    @property
+    def output_dir(self) -> str:
+        return join(self.path, 'output')
+
+    @property
+    def config(self) -> str:
+        return join(self.path, 'config.yaml')
+
+    def _uid(self) -> str:
+        return '%032x' % self._rand.getrandbits(128)
+
+    def _artists(self, count: int) -> str:
+        r = self._rand
+        return '|'.join(f'Artist {r.randrange(count)}' for _ in range(r.randint(1, 3)))  # noqa: E501
+
+    def _connect(self, path: str):
+        if exists(path):
+            remove(path)
+        return sqlite3.connect(path)
+
+    def generate(self):
+        makedirs(self.output_dir, exist_ok=True)
+        self._generate_library()
+        self._generate_users()
+        self._generate_activity()
+        with open(self.config, 'w', encoding='UTF-8') as f:
+            dumpyaml({'playback_reporting_db': self.playback_reporting_db,
+                      'library_db': self.library_db,
+                      'jellyfin_db': self.jellyfin_db,
+                      'output_dir': self.output_dir}, f)
+        return self
+
+    def _generate_library(self):
+        r = self._rand
+        artistCount = max(10, self.tracks // 20)
+        db = self._connect(self.library_db)
+        db.execute("CREATE TABLE TypedBaseItems (guid GUID primary key NOT NULL, type TEXT NOT NULL, data BLOB NULL, ParentId GUID NULL, Path TEXT NULL, IndexNumber INT NULL, Name TEXT NULL, ParentIndexNumber INT NULL, PremiereDate DATETIME NULL, ProductionYear INT NULL, Genres TEXT NULL, SortName TEXT NULL, RunTimeTicks BIGINT NULL, DateCreated DATETIME NULL, Album TEXT NULL, Studios TEXT NULL, PresentationUniqueKey TEXT NULL, Artists TEXT NULL, AlbumArtists TEXT NULL);")  # noqa: E501
+        self.albums = []
+        for i in range(max(1, self.tracks // 10)):
+            year = r.randint(1970, 2024)
+            self.albums.append((f'Album {i}', self._artists(artistCount), year,  # noqa: E501
+                                f'{year}-01-01 00:00:00' if i % 3 else f'{year}-{r.randint(1, 12):02}-{r.randint(1, 28):02} 00:00:00'))  # noqa: E501
+        db.executemany("INSERT INTO TypedBaseItems (guid, type, data, Name, PremiereDate, ProductionYear, Genres, SortName, RunTimeTicks, Studios, PresentationUniqueKey, Artists, AlbumArtists) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);", ((self._uid(), MUSIC_ALBUM_TYPE, dump_json({'Name': a[0]}).encode() * 8, a[0], a[3], a[2], 'Pop', a[0], 0, 'Studio', self._uid(), a[1], a[1]) for a in self.albums))  # noqa: E501
+        self.items = []
+
+        def audios():
+            for i in range(self.tracks):
+                album = self.albums[i % len(self.albums)]
+                name = f'Track {i}' if i % 7 else f'Track, "{i}"'
+                key = self._uid()
+                self.items.append((key, name, album[0], album[1]))
+                yield (self._uid(), AUDIO_TYPE, dump_json({'Name': name, 'Album': album[0]}).encode() * 16, f'/music/{i}.flac', i % 15 + 1, name, 1, None, album[2], 'Pop|Rock', name, r.randint(60, 480) * 10_000_000 + r.randrange(10_000_000), album[0], 'Studio', key, self._artists(artistCount), album[1])  # noqa: E501
+        db.executemany("INSERT INTO TypedBaseItems (guid, type, data, Path, IndexNumber, Name, ParentIndexNumber, PremiereDate, ProductionYear, Genres, SortName, RunTimeTicks, Album, Studios, PresentationUniqueKey, Artists, AlbumArtists) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);", audios())  # noqa: E501
+        db.commit()
+        db.close()
+
+    def _generate_users(self):
+        self.userIds = [self._uid() for _ in range(self.users)]
+        db = self._connect(self.jellyfin_db)
+        db.execute("CREATE TABLE Users (Id TEXT PRIMARY KEY NOT NULL, Username TEXT NOT NULL);")  # noqa: E501
+        db.executemany("INSERT INTO Users VALUES (?, ?);", ((format_uid(u), f'user{i}') for i, u in enumerate(self.userIds)))  # noqa: E501
+        db.commit()
+        db.close()
+
+    def _generate_activity(self):
+        r = self._rand
+        db = self._connect(self.playback_reporting_db)
+        db.execute("CREATE TABLE PlaybackActivity (DateCreated DATETIME NOT NULL, UserId TEXT, ItemId TEXT, ItemType TEXT, ItemName TEXT, PlaybackMethod TEXT, ClientName TEXT, DeviceName TEXT, PlayDuration INT);")  # noqa: E501
+        remappedIds = {}
+        missingIds = {}
+        step = max(1, int(6 * 365 * 86400 / max(1, self.plays)))
+
+        def rows():
+            time = datetime(2019, 1, 1)
+            missingCut = self.missing
+            remappedCut = missingCut + self.remapped
+            otherCut = remappedCut + self.other
+            for i in range(self.plays):
+                time += timedelta(seconds=r.randint(1, 2 * step), microseconds=r.randrange(1_000_000))  # noqa: E501
+                client = r.choice(CLIENTS)
+                x = r.random()
+                if remappedCut <= x < otherCut:
+                    yield (time.strftime('%Y-%m-%d %H:%M:%S.%f') + '0', r.choice(self.userIds), self._uid(), EPISODE_TYPE, 'Show - s01e01 - Pilot', r.choice(PLAYBACK_METHODS), client[0], client[1], r.randint(60, 3000))  # noqa: E501
+                    continue
+                if x < missingCut:
+                    itemId = self._uid()
+                    missingIds[itemId] = 'no_track'
+                    artist = 'Not Known' if i % 2 else 'Gone Artist'
+                    name = f'{artist} - Gone {i} (Not Known)'
+                else:
+                    key, track, album, albumArtists = r.choice(self.items)
+                    itemId = key
+                    if x < remappedCut:
+                        if key not in remappedIds:
+                            remappedIds[key] = self._uid()
+                        itemId = remappedIds[key]
+                    name = f'{albumArtists.split("|")[0]} - {track} ({album})'  # noqa: E501
+                yield (time.strftime('%Y-%m-%d %H:%M:%S.%f') + '0', r.choice(self.userIds), itemId, 'Audio', name, r.choice(PLAYBACK_METHODS), client[0], client[1], r.randint(5, 600))  # noqa: E501
+        db.executemany("INSERT INTO PlaybackActivity VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);", rows())  # noqa: E501
+        db.commit()
+        db.close()
+        if exists(join(self.output_dir, 'id_relative_cache.db')):
+            remove(join(self.output_dir, 'id_relative_cache.db'))
+        with open(join(self.output_dir, 'id_relative_cache.yaml'), 'w', encoding='UTF-8') as f:  # noqa: E501
+            dumpyaml({'version': 1, 'data': missingIds}, f, allow_unicode=True)  # noqa: E501
+
+
+if __name__ == '__main__':
+    Dataset(argv[1], int(argv[2]) if len(argv) > 2 else 10_000).generate()
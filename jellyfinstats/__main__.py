@@ -1,14 +1,11 @@
+import atexit
 from argparse import ArgumentParser
 from os.path import join
 from . import _
-from .audio import (
-    prepare_audio_map,
-    generate_audio_report,
-    fix_audio_report_library,
-)
-from .cache import IdRelativeCache
+from .aggregate import AGGREGATORS
 from .config import Config
-from .db import PlaybackReportingDb, LibraryDb, JellyfinDb
+from .metrics import metrics
+from .resources import Resources
 from .utils import (
     YearMonth,
     gen_month_range,
@@ -17,7 +14,6 @@ from .utils import (
     parse_year_month,
 )
 
-
 p = ArgumentParser(prog="jellyfinstats")
 p.add_argument("-c", "--config", help=_("The path to config file."), default="config.yaml")  # noqa: E501
 p.add_argument("--playback-reporting-db", help=_("The path to playback_reporting.db"))  # noqa: E501
@@ -26,11 +22,24 @@ p.add_argument("--jellyfin-data-dir", help=_("The path to jellyfin data director
 p.add_argument("--output-dir", help=_("The directory for output files."))
 p.add_argument("--ask-page-size", help=_("Specify maximum items to display in one page."), type=int)  # noqa: E501
 p.add_argument("--jellyfin-db", help=_("The path to jellyfin.db"))
+p.add_argument("--read-only", help=_("Open databases in read only mode."), action='store_true', default=False)  # noqa: E501
+p.add_argument("--snapshot-dir", help=_("Copy a snapshot of databases to this directory and read the snapshot instead."))  # noqa: E501
+p.add_argument("--unattended", help=_("Do not ask for missing items. Items which can not be matched automatically are added to a review queue."), action='store_true', default=False)  # noqa: E501
+p.add_argument("--match-threshold", help=_("Minimum score (0-1) of an automatic match in unattended mode. Default: 0.9"), type=float)  # noqa: E501
+p.add_argument("--metrics", help=_("Write timing and throughput of each stage to this JSON file."), metavar='FILE')  # noqa: E501
+p.add_argument("--profile", help=_("Run with cProfile and write the statistics to this file."), metavar='FILE')  # noqa: E501
 ps = p.add_subparsers(dest='action', help=_('sub-command help'), required=False, metavar='action')  # noqa: E501
 audio = ps.add_parser('audio', help=_('Generate audio report.'))
 audio.add_argument("--fix", help=_("Fix incorrect play duration."), action='store_true', default=False)  # noqa: E501
+audio.add_argument("--dry-run", help=_("Write the changes of --fix to a CSV file instead of applying them."), metavar='FILE')  # noqa: E501
+audio.add_argument("--review", help=_("Choose items in the review queue of unattended mode before generating reports."), action='store_true', default=False)  # noqa: E501
+audio.add_argument("--no-map-cache", help=_("Do not use or save the prepared audio map in the output directory."), action='store_true', default=False)  # noqa: E501
 audio.add_argument("-u", "--user", help=_("Generate report for specify users."), action='append', default=[])  # noqa: E501
 audio.add_argument("-i", "--user-id", help=_("Generate report for specify users."), action='append', default=[])  # noqa: E501
+audio.add_argument("--summary-only", help=_("Only generate summary files and aggregate plays in SQLite. history.csv is not generated. Not supported by full report."), action='store_true', default=False)  # noqa: E501
+audio.add_argument("-j", "--jobs", help=_("Number of processes used to generate reports."), type=int, default=1)  # noqa: E501
+audio.add_argument("--engine", help=_("Aggregation engine. Default: numpy if NumPy is installed, otherwise python."), choices=['python', 'numpy'])  # noqa: E501
+audio.add_argument("--pipeline", help=_("Read the database, aggregate and write history.csv in separate threads."), action='store_true', default=False)  # noqa: E501
 audios = audio.add_subparsers(dest='type', help=_("Report type. Default: ") + "all", required=False, metavar='type')  # noqa: E501
 audio_all = audios.add_parser('all', help=_("All time report"))
 audio_year = audios.add_parser('year', help=_("Year report"))
@@ -44,69 +53,178 @@ audio_month.add_argument('-s', '--start', help=_("The start month of range of mo
 audio_month.add_argument('-e', '--end', help=_("The end month of range of months."), type=parse_year_month)  # noqa: E501
 audio_month.add_argument('--utc', action='store_true', help=_("Use UTC time."), default=False)  # noqa: E501
 audio_month.add_argument('-y', '--year', action='append', help=_("Generate month report for specify years."), default=[], type=int)  # noqa: E501
+audio_full = audios.add_parser("full", help=_("All time, year and month reports in a single pass"))  # noqa: E501
+audio_full.add_argument('--utc', action='store_true', help=_("Use UTC time."), default=False)  # noqa: E501
+audio_full.add_argument('-y', '--year', action='append', help=_("Generate year and month reports for specify years."), default=[], type=int)  # noqa: E501
+audio_full.add_argument('--incremental', action='store_true', help=_("Only process new playback activities since last run."), default=False)  # noqa: E501
+stats = ps.add_parser('stats', help=_('Generate play statistics of all item types.'))  # noqa: E501
+stats.add_argument("-u", "--user", help=_("Generate statistics for specify users."), action='append', default=[])  # noqa: E501
+stats.add_argument("-i", "--user-id", help=_("Generate statistics for specify users."), action='append', default=[])  # noqa: E501
+stats.add_argument("-a", "--aggregator", help=_("Statistics to generate. Default: all"), action='append', default=[], choices=sorted(AGGREGATORS))  # noqa: E501
+stats.add_argument("--pipeline", help=_("Read the database in a separate thread."), action='store_true', default=False)  # noqa: E501
+serve_p = ps.add_parser('serve', help=_('Keep audio reports in memory, follow new plays and answer queries over HTTP.'))  # noqa: E501
+serve_p.add_argument("--host", help=_("The address to listen on. Default: 127.0.0.1"), default="127.0.0.1")  # noqa: E501
+serve_p.add_argument("--port", help=_("The port to listen on. Default: 8097"), type=int, default=8097)  # noqa: E501
+serve_p.add_argument("--interval", help=_("Seconds between checks for new plays. Default: ") + "5", type=float, default=5)  # noqa: E501
+serve_p.add_argument("-u", "--user", help=_("Serve reports of specify users."), action='append', default=[])  # noqa: E501
+serve_p.add_argument("-i", "--user-id", help=_("Serve reports of specify users."), action='append', default=[])  # noqa: E501
+serve_p.add_argument('-y', '--year', action='append', help=_("Keep year and month reports for specify years."), default=[], type=int)  # noqa: E501
+serve_p.add_argument('--utc', action='store_true', help=_("Use UTC time."), default=False)  # noqa: E501
 arg = p.parse_args()
+
+
+def get_years(minTime, maxTime):
+    for year in range(minTime.year, maxTime.year + 1):
+        if arg.year and year not in arg.year:
+            continue
+        if getattr(arg, 'start', None) is not None and year < arg.start:
+            continue
+        if getattr(arg, 'end', None) is not None and year > arg.end:
+            continue
+        yield year
+
+
+def get_months(minTime, maxTime):
+    minMonth = YearMonth(minTime.year, minTime.month)
+    maxMonth = YearMonth(maxTime.year, maxTime.month)
+    month = minMonth
+    while month <= maxMonth:
+        if arg.year and month.year not in arg.year:
+            month = YearMonth(month.year + 1, 1)
+            continue
+        if getattr(arg, 'month', None) and month not in arg.month:
+            month += 1
+            continue
+        if getattr(arg, 'start', None) is not None and month < arg.start:
+            month += 1
+            continue
+        if getattr(arg, 'end', None) is not None and month > arg.end:
+            month += 1
+            continue
+        yield month
+        month += 1
+
+
 if arg.action == 'a':
     arg.action = 'audio'
+if arg.action is None:
+    p.exit()
+if arg.action == 'audio' and arg.summary_only and arg.type == 'full':
+    p.error(_("--summary-only is not supported by full report."))
+if arg.action == 'audio' and arg.dry_run is not None and not arg.fix:
+    p.error(_("--dry-run requires --fix."))
+if arg.action == 'audio' and arg.engine != 'python':
+    from .columnar import AVAILABLE as COLUMNAR_AVAILABLE
+    if arg.engine is None:
+        arg.engine = 'numpy' if COLUMNAR_AVAILABLE else 'python'
+    elif not COLUMNAR_AVAILABLE:
+        p.error(_("NumPy is not installed."))
+if arg.metrics:
+    metrics.enable()
+    atexit.register(metrics.dump, arg.metrics)
+if arg.profile:
+    from cProfile import Profile
+    profiler = Profile()
+
+    def dump_profile():
+        profiler.disable()
+        profiler.dump_stats(arg.profile)
+    atexit.register(dump_profile)
+    profiler.enable()
 cfg = Config(arg.config, arg)
-with PlaybackReportingDb(cfg.playback_reporting_db) as pdb:
-    if arg.action == 'audio' and arg.fix:
-        fix_audio_report_library(pdb)
-    with LibraryDb(cfg.library_db) as ldb:
-        with IdRelativeCache(cfg.output_dir) as icache:
-            with JellyfinDb(cfg.jellyfin_db) as jdb:
-                if arg.action == 'audio':
-                    if arg.type is None:
-                        arg.type = 'all'
-                    re = prepare_audio_map(pdb, ldb, icache, cfg)
-                    users = pdb.get_users('Audio')
-                    for u in users:
-                        userid = u['UserId']
-                        user = jdb.get_user(userid)
-                        username = user['Username'] if user else userid
-                        if arg.user or arg.user_id:
-                            if username not in arg.user and userid not in arg.user_id:  # noqa: E501
-                                continue
-                        output = join(cfg.output_dir, 'audio', username)
-                        maxDate = u['MaxDate']
-                        minDate = u['MinDate']
-                        if arg.type == 'all':
-                            generate_audio_report(
-                                pdb, re[0], re[1], re[2], output, userid)
-                        elif arg.type == 'year':
-                            minTime = parse_datetime(minDate)
-                            minYear = minTime.year
-                            maxTime = parse_datetime(maxDate)
-                            maxYear = maxTime.year
-                            for year in range(minYear, maxYear + 1):
-                                if arg.year and year not in arg.year:
-                                    continue
-                                if arg.start is not None and year < arg.start:
-                                    continue
-                                if arg.end is not None and year > arg.end:
-                                    continue
-                                time = gen_year_range(year, arg.utc)
-                                toutput = join(output, str(year))
-                                generate_audio_report(pdb, re[0], re[1], re[2], toutput, userid, max(time[0], minTime.timestamp()), min(time[1], maxTime.timestamp()))  # noqa: E501
-                        elif arg.type == 'month':
-                            minTime = parse_datetime(minDate)
-                            minMonth = YearMonth(minTime.year, minTime.month)
-                            maxTime = parse_datetime(maxDate)
-                            maxMonth = YearMonth(maxTime.year, maxTime.month)
-                            month = minMonth
-                            while month <= maxMonth:
-                                if arg.year and month.year not in arg.year:
-                                    month = YearMonth(month.year + 1, 1)
-                                    continue
-                                if arg.month and month not in arg.month:
-                                    month += 1
-                                    continue
-                                if arg.start is not None and month < arg.start:
-                                    month += 1
-                                    continue
-                                if arg.end is not None and month > arg.end:
-                                    month += 1
-                                    continue
-                                time = gen_month_range(month, arg.utc)
-                                toutput = join(output, str(month.year), str(month.month).rjust(2, '0'))  # noqa: E501
-                                generate_audio_report(pdb, re[0], re[1], re[2], toutput, userid, max(time[0], minTime.timestamp()), min(time[1], maxTime.timestamp()))  # noqa: E501
-                                month += 1
+if arg.action == 'serve' and cfg.snapshot_dir:
+    p.error(_("serve can not follow new plays in a snapshot."))
+if arg.action == 'audio' and arg.fix:
+    from .audio import fix_audio_report_library
+    from .db import PlaybackReportingDb
+    with PlaybackReportingDb(cfg.playback_reporting_db) as pdb:
+        fix_audio_report_library(pdb, arg.dry_run)
+with Resources(cfg) as res:
+    if arg.action == 'audio':
+        from .audio import (
+            REPORT_STATE_FILE,
+            AudioReportSet,
+            load_audio_map,
+            prepare_audio_map,
+            review_audio_queue,
+            generate_audio_report_tasks,
+            generate_audio_reports,
+            remove_report_state,
+        )
+        pdb = res.pdb
+        if arg.type is None:
+            arg.type = 'all'
+        if arg.review:
+            review_audio_queue(res.ldb, res.icache, cfg)
+        if arg.no_map_cache:
+            re = prepare_audio_map(pdb, res.ldb, res.icache, cfg)
+        else:
+            re = load_audio_map(pdb, res.ldb, res.icache, cfg, cfg.playback_reporting_db, cfg.library_db)  # noqa: E501
+        userIds = None
+        if arg.user or arg.user_id:
+            userIds = res.users.find_user_ids(arg.user, arg.user_id)
+        users = pdb.get_users('Audio', userIds)
+        tasks = []
+        if arg.type == 'full':
+            reports = AudioReportSet(arg.utc, arg.year, arg.user + arg.user_id, arg.engine == 'numpy')  # noqa: E501
+        for u in users:
+            userid = u['UserId']
+            username = res.users.get_username(userid)
+            output = join(cfg.output_dir, 'audio', username)
+            maxDate = u['MaxDate']
+            minDate = u['MinDate']
+            if arg.type == 'all':
+                tasks.append((output, userid))
+            elif arg.type == 'year':
+                minTime = parse_datetime(minDate)
+                maxTime = parse_datetime(maxDate)
+                for year in get_years(minTime, maxTime):
+                    time = gen_year_range(year, arg.utc)
+                    toutput = join(output, str(year))
+                    tasks.append((toutput, userid, time[0], time[1]))  # noqa: E501
+            elif arg.type == 'month':
+                minTime = parse_datetime(minDate)
+                maxTime = parse_datetime(maxDate)
+                for month in get_months(minTime, maxTime):
+                    time = gen_month_range(month, arg.utc)
+                    toutput = join(output, str(month.year), str(month.month).rjust(2, '0'))  # noqa: E501
+                    tasks.append((toutput, userid, time[0], time[1]))  # noqa: E501
+            elif arg.type == 'full':
+                minTime = parse_datetime(minDate)
+                maxTime = parse_datetime(maxDate)
+                reports.add_user(userid, output)
+                for year in get_years(minTime, maxTime):
+                    reports.add_period(userid, year)
+                for month in get_months(minTime, maxTime):
+                    reports.add_period(userid, month)
+        statePath = join(cfg.output_dir, REPORT_STATE_FILE)
+        if tasks and not arg.summary_only:
+            # The history files of the saved state are rewritten.
+            remove_report_state(statePath)
+        generate_audio_report_tasks(
+            pdb, res.playback_reporting_db, re[0], re[1], re[2], tasks,
+            arg.jobs, arg.summary_only, arg.engine == 'numpy', arg.pipeline)
+        if arg.type == 'full':
+            generate_audio_reports(pdb, re[0], re[1], re[2], reports,
+                                   statePath, arg.pipeline, arg.incremental)
+    elif arg.action == 'stats':
+        from .aggregate import UserAggregator, run_aggregators
+        pdb = res.pdb
+        names = arg.aggregator if arg.aggregator else sorted(AGGREGATORS)
+        userIds = None
+        if arg.user or arg.user_id:
+            userIds = res.users.find_user_ids(arg.user, arg.user_id)
+        aggregators = {}
+        for u in pdb.get_users(userIds=userIds):
+            userid = u['UserId']
+            username = res.users.get_username(userid)
+            output = join(cfg.output_dir, 'stats', username)
+            aggregators[userid] = [AGGREGATORS[n](output) for n in names]
+        run_aggregators(pdb, [UserAggregator(aggregators)],
+                        maxRowId=pdb.get_max_rowid(), pipelined=arg.pipeline)
+    elif arg.action == 'serve':
+        from .audio import load_audio_map
+        from .serve import StatsService, serve
+        re = load_audio_map(res.pdb, res.ldb, res.icache, cfg, cfg.playback_reporting_db, cfg.library_db)  # noqa: E501
+        service = StatsService(res.pdb, res.ldb, res.icache, cfg, re, res.users.get_username, arg.utc, arg.year, arg.user + arg.user_id)  # noqa: E501
+        serve(service, arg.host, arg.port, arg.interval)
@@ -0,0 +1,232 @@
+"""Single-scan aggregation of playback activities.
+
+Every aggregator declares the ``PlaybackActivity`` columns and item types
+it needs. :func:`run_aggregators` reads the table once and passes each row
+to every aggregator interested in it, so another report costs CPU time but
+no extra scan."""
+from os import makedirs
+from os.path import join
+from typing import Dict, List, Tuple
+from . import _
+from .csv import CSVFile
+from .db import PlaybackReportingDb
+from .pipeline import ThreadedReader
+from .utils import format_duration
+
+
+def _read_activity_pages(dbPath: str, kwargs):
+    with PlaybackReportingDb(dbPath, True) as pdb:
+        yield from pdb.iter_activity_pages(**kwargs)
+
+
+def iter_activity_pages(pdb: PlaybackReportingDb, pipelined: bool = False,
+                        **kwargs):
+    """:meth:`PlaybackReportingDb.iter_activity_pages`, fetched by a reader
+    thread with its own read-only connection if ``pipelined``."""
+    if not pipelined:
+        return pdb.iter_activity_pages(**kwargs)
+    dbPath = pdb.path
+    return ThreadedReader(lambda: _read_activity_pages(dbPath, kwargs))
+
+
+class Aggregator:
+    """Base class of aggregators.
+
+    ``columns`` are the columns read in :meth:`add`, ``itemTypes`` the item
+    types of the rows passed to it (None for all)."""
+    columns: Tuple[str, ...] = ()
+    itemTypes: Tuple[str, ...] | None = None
+
+    def add(self, row):
+        raise NotImplementedError()
+
+    def flush(self):
+        """Called after each page of rows, e.g. to write buffered output."""
+        pass
+
+    def finish(self):
+        """Called once after the last row."""
+        pass
+
+
+def _item_types(aggregators: List[Aggregator]):
+    """Union of the item types of ``aggregators``, None for all types."""
+    itemTypes = set()
+    for a in aggregators:
+        if a.itemTypes is None:
+            return None
+        itemTypes.update(a.itemTypes)
+    return tuple(sorted(itemTypes))
+
+
+def _dispatch(aggregators: List[Aggregator], itemTypes):
+    """Columns read for ``aggregators`` and their ``(add, itemTypes)``
+    targets for rows of ``itemTypes``. ``itemTypes`` of a target is None
+    if the rows need not be filtered for it."""
+    columns = set()
+    targets = []
+    for a in aggregators:
+        columns.update(a.columns)
+        types = None
+        if a.itemTypes is not None and (itemTypes is None or set(a.itemTypes) != set(itemTypes)):  # noqa: E501
+            types = set(a.itemTypes)
+            columns.add('ItemType')
+        targets.append((a.add, types))
+    return columns, targets
+
+
+def run_aggregators(pdb: PlaybackReportingDb, aggregators: List[Aggregator],
+                    afterRowId: int = None, maxRowId: int = None,
+                    pipelined: bool = False):
+    """Feed activities to ``aggregators`` with one scan of
+    ``PlaybackActivity``, then call their :meth:`Aggregator.finish`."""
+    itemTypes = _item_types(aggregators)
+    columns, targets = _dispatch(aggregators, itemTypes)
+    for page in iter_activity_pages(pdb, pipelined, afterRowId=afterRowId,
+                                    maxRowId=maxRowId,
+                                    columns=sorted(columns),
+                                    itemTypes=itemTypes):
+        for row in page:
+            for add, types in targets:
+                if types is None or row['ItemType'] in types:
+                    add(row)
+        for a in aggregators:
+            a.flush()
+    for a in aggregators:
+        a.finish()
+
+
+class CountAggregator(Aggregator):
+    """Record count and play duration per key, written to ``fileName`` in
+    ``output``."""
+    fileName = ''
+
+    def __init__(self, output: str):
+        self.output = output
+        self.counts = {}
+
+    def key(self, row) -> tuple:
+        raise NotImplementedError()
+
+    def header(self) -> tuple:
+        raise NotImplementedError()
+
+    def add(self, row):
+        key = self.key(row)
+        count = self.counts.get(key)
+        if count is None:
+            self.counts[key] = [1, row['PlayDuration']]
+        else:
+            count[0] += 1
+            count[1] += row['PlayDuration']
+
+    def finish(self):
+        makedirs(self.output, exist_ok=True)
+        with CSVFile(join(self.output, self.fileName)) as f:
+            f.write(*self.header(), _("Record count"), _("Play duration"), _("Play duration") + _("(seconds)"))  # noqa: E501
+            f.write_rows(key + (count, format_duration(duration), duration) for key, (count, duration) in self.counts.items())  # noqa: E501
+
+
+class ItemTypeAggregator(CountAggregator):
+    columns = ('ItemType', 'PlayDuration')
+    fileName = 'item_type.csv'
+
+    def key(self, row):
+        return (row['ItemType'],)
+
+    def header(self):
+        return (_("Item type"),)
+
+
+class ClientAggregator(CountAggregator):
+    columns = ('ClientName', 'DeviceName', 'PlayDuration')
+    fileName = 'client.csv'
+
+    def key(self, row):
+        return (row['ClientName'], row['DeviceName'])
+
+    def header(self):
+        return (_("Client name"), _("Device name"))
+
+
+class PlaybackMethodAggregator(CountAggregator):
+    columns = ('PlaybackMethod', 'PlayDuration')
+    fileName = 'playback_method.csv'
+
+    def key(self, row):
+        return (row['PlaybackMethod'],)
+
+    def header(self):
+        return (_("Playback method"),)
+
+
+class ItemAggregator(CountAggregator):
+    """Plays per item of one item type, e.g. ``Episode`` or ``Movie``."""
+    columns = ('ItemId', 'ItemName', 'PlayDuration')
+
+    def __init__(self, output: str, itemType: str, fileName: str):
+        super().__init__(output)
+        self.itemTypes = (itemType,)
+        self.fileName = fileName
+        self.names = {}
+
+    def key(self, row):
+        itemId = row['ItemId']
+        if itemId not in self.names:
+            self.names[itemId] = row['ItemName']
+        return (itemId,)
+
+    def header(self):
+        return (_("Name"), _("Item id"))
+
+    def finish(self):
+        self.counts = {(self.names[k[0]],) + k: v for k, v in self.counts.items()}  # noqa: E501
+        super().finish()
+
+
+class UserAggregator(Aggregator):
+    """Pass rows to the aggregators of their user."""
+    def __init__(self, aggregators: Dict[str, List[Aggregator]]):
+        self.aggregators = aggregators
+        self.itemTypes = _item_types([a for i in aggregators.values() for a in i])  # noqa: E501
+        columns = {'UserId'}
+        self._targets = {}
+        for userId, userAggregators in aggregators.items():
+            c, self._targets[userId] = _dispatch(userAggregators,
+                                                 self.itemTypes)
+            columns.update(c)
+        self.columns = tuple(sorted(columns))
+
+    def add(self, row):
+        targets = self._targets.get(row['UserId'])
+        if targets is None:
+            return
+        for add, types in targets:
+            if types is None or row['ItemType'] in types:
+                add(row)
+
+    def flush(self):
+        for userId in self.aggregators:
+            for a in self.aggregators[userId]:
+                a.flush()
+
+    def finish(self):
+        for userId in self.aggregators:
+            for a in self.aggregators[userId]:
+                a.finish()
+
+
+AGGREGATORS = {}
+
+
+def register_aggregator(name: str, factory):
+    """Register ``factory(output)`` which returns an :class:`Aggregator`
+    for the ``stats`` action."""
+    AGGREGATORS[name] = factory
+
+
+register_aggregator('item_type', ItemTypeAggregator)
+register_aggregator('client', ClientAggregator)
+register_aggregator('playback_method', PlaybackMethodAggregator)
+register_aggregator('episode', lambda output: ItemAggregator(output, 'Episode', 'episode.csv'))  # noqa: E501
+register_aggregator('movie', lambda output: ItemAggregator(output, 'Movie', 'movie.csv'))  # noqa: E501
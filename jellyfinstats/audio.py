@@ -1,19 +1,42 @@
 from . import _
-from .cache import IdRelativeCache
+from .aggregate import Aggregator, iter_activity_pages, run_aggregators
+from .cache import IdRelativeCache, VERSION as CACHE_VERSION
 from .config import Config
-from .csv import CSVFile
-from .db import PlaybackReportingDb, LibraryDb
-from .utils import ask_choice, format_duration, parse_time
-from datetime import datetime
+from .csv import CSVFile, OpenMode
+from .db import PlaybackReportingDb, LibraryDb, add_activity_checksums
+from .match import AudioMatcher, ReviewQueue
+from .metrics import measure, metrics
+from .pipeline import ThreadedWriter
+from .utils import (
+    ask_choice,
+    format_duration,
+    format_local_time,
+    parse_time,
+    parse_time_us,
+    parse_year_month,
+    YearMonth,
+)
+from array import array
+from functools import partial
+from itertools import chain
+from json import dump as dump_json, load as load_json
 from re import compile
-from os import makedirs
-from os.path import join
+from os import SEEK_END, makedirs, remove, replace, stat
+from os.path import exists, join
+from pickle import dump as dump_pickle, load as load_pickle, HIGHEST_PROTOCOL
+from typing import List
 from math import ceil, floor
 
 
 ITEMNAME_PATTERN = compile(r'(?P<album_artist>.*) - (?P<track>.*) \((?P<album>.*)\)')  # noqa: E501
 NOT_KNOWN = "Not Known"
 TIME_BASE = 10_000_000
+COLUMNAR_CHUNK_ROWS = 4096
+REVIEW_QUEUE_FILE = 'audio_review_queue.json'
+REPORT_STATE_FILE = 'audio_report_state.json'
+REVIEW_CANDIDATES = 10
+AUDIO_MAP_CACHE_FILE = 'audio_map_cache.pickle'
+AUDIO_MAP_CACHE_VERSION = 1
 
 
 def print_item(item):
@@ -102,6 +125,7 @@ class AudioSelector:
         items = self.ldb.get_audios(album=album)
         self.handle_items(items)
 
+    @measure('ask_audio')
     def ask(self):
         self.print_original()
         if self.choices:
@@ -115,92 +139,126 @@ class AudioSelector:
         return self.re
 
 
+@measure('prepare_audio_map')
 def prepare_audio_map(pdb: PlaybackReportingDb, ldb: LibraryDb,
                       icache: IdRelativeCache, cfg: Config):
-    offset = 0
-    data = pdb.get_activitys(offset, itemType='Audio')
-    re = None
+    """Resolve played items to library items.
+
+    Missing items are asked with :class:`AudioSelector`, or with
+    ``cfg.unattended`` matched with :class:`AudioMatcher`; items without a
+    confident match are added to the review queue instead."""
+    ldb.preload_audios()
+    ldb.preload_albums()
     itemMap = {}
-    rowMap = {}
-    while len(data) > 0:
-        for d in data:
-            itemId = d['ItemId']
-            rowid = d['rowid']
-            item = ldb.get_item(itemId)
-            if not item:
-                re = icache.get(itemId)
-                if re and isinstance(re, str):
-                    if re == 'no_track':
-                        if itemId in itemMap:
-                            rowMap[rowid] = itemId
-                        else:
-                            itemMap[itemId] = d
-                            rowMap[rowid] = itemId
-                        continue
-                    re = None
-                elif re:
-                    item = ldb.get_item(re['id'])
-                    if item and item['PresentationUniqueKey'] in itemMap:
-                        rowMap[rowid] = item['PresentationUniqueKey']
-                        continue
-                else:
-                    if itemId in itemMap:
-                        rowMap[rowid] = itemId
-                        continue
-            else:
-                if itemId in itemMap:
-                    rowMap[rowid] = itemId
+    idMap = {}
+    albumMap = {}
+    resolve_audio_items(pdb.iter_activity_items(itemType='Audio'), ldb,
+                        icache, cfg, itemMap, idMap)
+    add_audio_albums(ldb, itemMap, albumMap, itemMap)
+    return itemMap, idMap, albumMap
+
+
+def resolve_audio_items(items, ldb: LibraryDb, icache: IdRelativeCache,
+                        cfg: Config, itemMap, idMap, unattended: bool = None,
+                        matcher: AudioMatcher = None,
+                        queue: ReviewQueue = None):
+    """Resolve played ``items`` (rows with ``ItemId`` and ``ItemName``) and
+    add them to ``itemMap`` and ``idMap``. ``unattended`` overrides
+    ``cfg.unattended``.
+
+    A given ``queue`` implies unattended resolution and is left to the
+    caller to save. ``matcher`` is created on demand if not given."""
+    ownQueue = queue is None
+    if unattended is None:
+        unattended = cfg.unattended
+    if ownQueue and unattended:
+        queue = ReviewQueue(join(cfg.output_dir, REVIEW_QUEUE_FILE))
+    re = None
+    for d in items:
+        itemId = d['ItemId']
+        item = ldb.get_item(itemId)
+        if not item:
+            re = icache.get(itemId)
+            if re and isinstance(re, str):
+                if re == 'no_track':
+                    itemMap[itemId] = d
+                    idMap[itemId] = itemId
                     continue
-            if not item:
-                itemName = d['ItemName']
-                if re is None:
-                    re = ITEMNAME_PATTERN.match(itemName)
-                if re is None:
-                    raise ValueError(f"Failed to parse ItemName: {itemName}")
-                re = re.groupdict()
-                if re['album_artist'] == NOT_KNOWN:
-                    re['album_artist'] = None
-                if re['album'] == NOT_KNOWN:
-                    re['album'] = None
-                items = ldb.get_audios(re['track'], re['album'])
-                if len(items) == 1:
-                    newId = items[0]['PresentationUniqueKey']
-                    icache.set(itemId, newId, {'album': items[0]['Album'], 'track': items[0]['Name'], 'album_artist': items[0]['AlbumArtists'], 'original': re})  # noqa: E501
-                    item = items[0]
+                re = None
+            elif re:
+                item = ldb.get_item(re['id'])
+                re = None
+        if not item:
+            itemName = d['ItemName']
+            if re is None:
+                re = ITEMNAME_PATTERN.match(itemName)
+            if re is None:
+                raise ValueError(f"Failed to parse ItemName: {itemName}")
+            re = re.groupdict()
+            if re['album_artist'] == NOT_KNOWN:
+                re['album_artist'] = None
+            if re['album'] == NOT_KNOWN:
+                re['album'] = None
+            items = ldb.get_audios(re['track'], re['album'])
+            if len(items) == 1:
+                newId = items[0]['PresentationUniqueKey']
+                icache.set(itemId, newId, {'album': items[0]['Album'], 'track': items[0]['Name'], 'album_artist': items[0]['AlbumArtists'], 'original': re})  # noqa: E501
+                item = items[0]
+            else:
+                if not len(items):
+                    items = ldb.get_audios(re['track'])
+                if not len(items) and re['album']:
+                    items = ldb.get_audios(album=re['album'])
+                if queue is not None:
+                    if matcher is None:
+                        matcher = AudioMatcher(ldb.get_audios())
+                    item, scored = matcher.match(re, cfg.match_threshold, items)  # noqa: E501
+                    if item:
+                        newId = item['PresentationUniqueKey']
+                        icache.set(itemId, newId, {'album': item['Album'], 'track': item['Name'], 'album_artist': item['AlbumArtists'], 'original': re, 'score': scored[0][0]})  # noqa: E501
+                        queue.remove(itemId)
+                    else:
+                        queue.add(itemId, re, scored[:REVIEW_CANDIDATES])
                 else:
-                    if not len(items):
-                        items = ldb.get_audios(re['track'])
-                    if not len(items) and re['album']:
-                        items = ldb.get_audios(album=re['album'])
                     item = AudioSelector(cfg, re, ldb, items).ask()
                     if item:
                         newId = item['PresentationUniqueKey']
                         icache.set(itemId, newId, {'album': item['Album'], 'track': item['Name'], 'album_artist': item['AlbumArtists'], 'original': re})  # noqa: E501
                     else:
                         icache.set_value(itemId, 'no_track')
-            if item:
-                itemId = item['PresentationUniqueKey']
-                itemMap[itemId] = item
-                rowMap[rowid] = itemId
-            else:
-                itemMap[itemId] = d
-                rowMap[rowid] = itemId
-        offset += len(data)
-        data = pdb.get_activitys(offset, itemType='Audio')
-    albumMap = {}
-    for itemId in itemMap:
+        if item:
+            newId = item['PresentationUniqueKey']
+            if newId not in itemMap:
+                itemMap[newId] = item
+            idMap[itemId] = newId
+        else:
+            itemMap[itemId] = d
+            idMap[itemId] = itemId
+    if queue is not None and ownQueue:
+        queue.save()
+        if len(queue):
+            print(_("%i missing items need review. Run audio --review to choose them.") % (len(queue)))  # noqa: E501
+
+
+def add_audio_albums(ldb: LibraryDb, itemMap, albumMap, itemIds):
+    """Add the albums of ``itemIds`` in ``itemMap`` to ``albumMap``."""
+    for itemId in itemIds:
         item = itemMap[itemId]
         album = ''
         album_artists = ''
+        arts = []
         if 'type' in item:
             album = item['Album']
             album_artists = item['AlbumArtists']
+            if album_artists:
+                arts = album_artists.split("|")
         else:
             it = ITEMNAME_PATTERN.match(item['ItemName']).groupdict()
             if it['album'] != NOT_KNOWN:
                 album = it['album']
             if it['album_artist'] != NOT_KNOWN:
                 album_artists = it['album_artist']
+                arts = album_artists.split(",")
         if album:
             if album not in albumMap:
                 album_artists = album_artists if album_artists else None
@@ -210,8 +268,7 @@ def prepare_audio_map(pdb: PlaybackReportingDb, ldb: LibraryDb,
                 if len(items) == 1:
                     albumMap[album] = items[0]
                 elif len(items) > 1:
-                    print(len(items))
-                    raise NotImplementedError('FIX ME')
+                    albumMap[album] = choose_album(items, arts)
                 else:
                     data = {'name': album}
                     if 'type' in item:
@@ -225,49 +282,329 @@ def prepare_audio_map(pdb: PlaybackReportingDb, ldb: LibraryDb,
                         data['year'] = None
                         data['publisher'] = None
                     albumMap[album] = data
-    return itemMap, rowMap, albumMap
 
 
-def generate_audio_report(pdb: PlaybackReportingDb, itemMap, rowMap, albumMap,
-                          output: str, userId: str = None,
-                          startTime: float = None, endTime: float = None):
-    makedirs(output, exist_ok=True)
-    offset = 0
-    data = pdb.get_activitys(offset, itemType='Audio', userId=userId,
-                             startTime=startTime, endTime=endTime)
-    albumCountMap = {}
-    trackCountMap = {}
-    artistCountMap = {}
-    alArtCountMap = {}
-    with CSVFile(join(output, "history.csv")) as his:
-        his.write(_("Id"), _("Date"), _("Time"), _("Name"), _("Artists"), _("Album"), _("Album artists"), _("Duration"), _("Duration") + _("(seconds)"), _("Original item id"), _("Item id"), _("Play duration"), _("Play duration") + _("(seconds)"), _("Record content"), _("Client name"), _("Device name"), _("Playback method"), _("Play count"))  # noqa: E501
-        while len(data) > 0:
-            for i in data:
-                rowid = i['rowid']
-                itemId = rowMap[rowid]
-                created = datetime.fromtimestamp(parse_time(i['DateCreated']),
-                                                 None)
-                date = created.strftime("%Y-%m-%d")
-                time = created.strftime("%H:%M:%S.%f")
+def choose_album(albums, album_artists: List[str]):
+    """Choose one of several albums with the same name.
+
+    The album sharing most album artists with the track wins; ties go to
+    the lowest ``PresentationUniqueKey`` so every run makes the same
+    choice."""
+    arts = {a.strip() for a in album_artists}
+
+    def key(item):
+        other = item['AlbumArtists']
+        other = {a.strip() for a in other.split("|")} if other else set()
+        return (-len(arts & other), item['PresentationUniqueKey'] or '')
+    return min(albums, key=key)
+
+
+def file_fingerprint(path: str):
+    """Size and mtime of a database and of its write-ahead log if there is
+    one, as changes in the log leave the database file untouched until a
+    checkpoint."""
+    st = stat(path)
+    re = [st.st_size, st.st_mtime_ns]
+    if exists(path + '-wal'):
+        st = stat(path + '-wal')
+        re += [st.st_size, st.st_mtime_ns]
+    return re
+
+
+def get_audio_map_key(pdb: PlaybackReportingDb, ldb: LibraryDb,
+                      icache: IdRelativeCache, cfg: Config,
+                      playbackReportingDb: str, libraryDb: str):
+    """Everything the result of :func:`prepare_audio_map` depends on."""
+    return {
+        'version': AUDIO_MAP_CACHE_VERSION,
+        'playback_reporting_db': file_fingerprint(playbackReportingDb) + [pdb.get_max_rowid()],  # noqa: E501
+        'library_db': file_fingerprint(libraryDb) + [ldb.get_max_rowid()],
+        'id_relative_cache': [CACHE_VERSION] + file_fingerprint(icache.path),  # noqa: E501
+        'unattended': cfg.unattended,
+        'match_threshold': cfg.match_threshold if cfg.unattended else None,
+    }
+
+
+def load_audio_map(pdb: PlaybackReportingDb, ldb: LibraryDb,
+                   icache: IdRelativeCache, cfg: Config,
+                   playbackReportingDb: str, libraryDb: str):
+    """:func:`prepare_audio_map` with the result saved in the output dir.
+
+    The saved maps are used while both databases (size, mtime and max
+    ROWID, including their write-ahead logs) and the id relative cache are
+    unchanged. Pass the paths of the
+    original databases when reading snapshots."""
+    path = join(cfg.output_dir, AUDIO_MAP_CACHE_FILE)
+    key = get_audio_map_key(pdb, ldb, icache, cfg, playbackReportingDb,
+                            libraryDb)
+    if exists(path):
+        try:
+            with open(path, 'rb') as f:
+                data = load_pickle(f)
+            if data['key'] == key:
+                return data['maps']
+        except Exception:
+            from traceback import print_exc
+            print_exc()
+            print(_("Failed to load prepared audio map."))
+    maps = prepare_audio_map(pdb, ldb, icache, cfg)
+    # Missing items may have been added to the id relative cache.
+    key['id_relative_cache'] = [CACHE_VERSION] + file_fingerprint(icache.path)  # noqa: E501
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        dump_pickle({'key': key, 'maps': maps}, f, HIGHEST_PROTOCOL)
+    replace(tmp, path)
+    return maps
+
+
+def review_audio_queue(ldb: LibraryDb, icache: IdRelativeCache, cfg: Config):
+    """Ask for every item in the review queue with :class:`AudioSelector`.
+
+    Each answer is saved at once, so the review can be interrupted."""
+    queue = ReviewQueue(join(cfg.output_dir, REVIEW_QUEUE_FILE))
+    if not len(queue):
+        return
+    ldb.preload_audios()
+    for itemId in list(queue.items):
+        entry = queue.items[itemId]
+        origin = entry['original']
+        choices = [ldb.get_item(c['id']) for c in entry['candidates']]
+        choices = [i for i in choices if i]
+        item = AudioSelector(cfg, origin, ldb, choices).ask()
+        if item:
+            newId = item['PresentationUniqueKey']
+            icache.set(itemId, newId, {'album': item['Album'], 'track': item['Name'], 'album_artist': item['AlbumArtists'], 'original': origin})  # noqa: E501
+        else:
+            icache.set_value(itemId, 'no_track')
+        queue.remove(itemId)
+        queue.save()
+
+
+def write_history_header(his: CSVFile):
+    his.write(_("Id"), _("Date"), _("Time"), _("Name"), _("Artists"), _("Album"), _("Album artists"), _("Duration"), _("Duration") + _("(seconds)"), _("Original item id"), _("Item id"), _("Play duration"), _("Play duration") + _("(seconds)"), _("Record content"), _("Client name"), _("Device name"), _("Playback method"), _("Play count"))  # noqa: E501
+
+
+def add_count(countMap, key, play_count, play_duration, count=1):
+    if key in countMap:
+        tmp = countMap[key]
+        tmp['count'] += count
+        tmp['play_count'] += play_count
+        tmp['duration'] += play_duration
+    else:
+        countMap[key] = {'count': count, 'play_count': play_count,
+                         'duration': play_duration}
+
+
+def get_play_count(play_duration, duration) -> int:
+    play_count = floor(play_duration / duration)
+    extrad = play_duration % duration
+    if extrad > 60 or extrad > duration * 0.95:
+        play_count += 1
+    return play_count
+
+
+def get_audio_info(item):
+    """Return name, artists, album, album artists, duration and the lists
+    of artists and album artists of an item of ``itemMap``."""
+    name = ''
+    artists = ''
+    album = ''
+    album_artists = ''
+    duration = None
+    if 'type' in item:
+        name = item['Name']
+        artists = item['Artists']
+        album = item['Album']
+        album_artists = item['AlbumArtists']
+        duration = item['RunTimeTicks'] / 10_000_000
+        arts = album_artists.split("|") if album_artists else []
+    else:
+        it = ITEMNAME_PATTERN.match(item['ItemName']).groupdict()
+        name = it['track']
+        if it['album'] != NOT_KNOWN:
+            album = it['album']
+        if it['album_artist'] != NOT_KNOWN:
+            album_artists = it['album_artist']
+        arts = album_artists.split(",") if album_artists else []
+    return (name, artists, album, album_artists, duration,
+            artists.split("|") if artists else [], arts)
+
+
+def history_row(i, itemId, info, play_count):
+    date, time = format_local_time(parse_time_us(i['DateCreated']))
+    play_duration = i['PlayDuration']
+    return (i['rowid'], date, time, info[0], info[1], info[2], info[3], format_duration(info[4]), info[4], i['ItemId'], itemId, format_duration(play_duration), play_duration, i['ItemName'], i['ClientName'], i['DeviceName'], i['PlaybackMethod'], play_count)  # noqa: E501
+
+
+class AudioRecord:
+    __slots__ = ('row', 'date', 'created', 'itemId', 'info', 'album',
+                 'artists', 'album_artists', 'play_duration', 'play_count')
+
+    def __init__(self, i, itemMap, idMap):
+        rowid = i['rowid']
+        itemId = idMap[i['ItemId']]
+        created = i['DateCreated']
+        date, time = format_local_time(parse_time_us(created))
+        self.info = info = get_audio_info(itemMap[itemId])
+        name, artists, album, album_artists, duration, self.artists, self.album_artists = info  # noqa: E501
+        original_item_id = i['ItemId']
+        play_duration = i['PlayDuration']
+        play_count = 1
+        # Items without a (non-zero) duration count as one play.
+        if duration:
+            play_count = get_play_count(play_duration, duration)
+        self.row = (rowid, date, time, name, artists, album, album_artists, format_duration(duration), duration, original_item_id, itemId, format_duration(play_duration), play_duration, i['ItemName'], i['ClientName'], i['DeviceName'], i['PlaybackMethod'], play_count)  # noqa: E501
+        self.date = date
+        self.created = created
+        self.itemId = itemId
+        self.album = album
+        self.play_duration = play_duration
+        self.play_count = play_count
+
+
+class AudioReport:
+    """Counters of one audio report.
+
+    When ``keepHistory`` is set, history rows are buffered until
+    :meth:`flush` or :meth:`write`. The first flush creates ``history.csv``
+    and sets ``append``, later ones append to it. With ``append`` set
+    beforehand the rows are appended to an existing history file.
+
+    With ``items``, plays passed to :meth:`add` are collected in
+    :class:`ColumnarCounts` and summed when the report is
+    written."""
+    def __init__(self, output: str, keepHistory: bool = True, items=None):
+        self.output = output
+        self.history = [] if keepHistory else None
+        self.append = False
+        self.lastRowId = None
+        self.columns = None
+        if items:
+            from .columnar import ColumnarCounts
+            self.columns = ColumnarCounts(items)
+        self.albumCountMap = {}
+        self.trackCountMap = {}
+        self.artistCountMap = {}
+        self.alArtCountMap = {}
+
+    def add(self, rec: AudioRecord):
+        if self.history is not None:
+            self.history.append(rec.row)
+            self.lastRowId = rec.row[0]
+        if self.columns is not None:
+            self.columns.add(self.columns.items.get(rec.itemId, rec.info),
+                             rec.play_count, rec.play_duration)
+            return
+        self.add_plays(rec.itemId, rec.album, rec.artists, rec.album_artists,
+                       rec.play_count, rec.play_duration)
+
+    def add_plays(self, itemId: str, album: str, artists: List[str],
+                  album_artists: List[str], play_count, play_duration,
+                  count: int = 1):
+        """Add ``count`` plays with total ``play_count`` and
+        ``play_duration``."""
+        if album:
+            add_count(self.albumCountMap, album, play_count, play_duration,
+                      count)
+        add_count(self.trackCountMap, itemId, play_count, play_duration,
+                  count)
+        for art in artists:
+            add_count(self.artistCountMap, art.strip(), play_count,
+                      play_duration, count)
+        for art in album_artists:
+            add_count(self.alArtCountMap, art.strip(), play_count,
+                      play_duration, count)
+
+    def reduce(self):
+        """Sum plays collected in columns into the count maps."""
+        if self.columns is not None:
+            self.columns.reduce(add_count, self.albumCountMap,
+                                self.trackCountMap, self.artistCountMap,
+                                self.alArtCountMap)
+
+    def flush(self):
+        """Write the buffered history rows to ``history.csv``."""
+        if self.history is None:
+            return
+        if self.append:
+            if self.history:
+                with CSVFile(join(self.output, "history.csv"), OpenMode.Append) as his:  # noqa: E501
+                    his.write_rows(self.history)
+        else:
+            makedirs(self.output, exist_ok=True)
+            with CSVFile(join(self.output, "history.csv")) as his:
+                write_history_header(his)
+                his.write_rows(self.history)
+            self.append = True
+        self.history.clear()
+
+    def write(self, itemMap, albumMap):
+        output = self.output
+        makedirs(output, exist_ok=True)
+        self.reduce()
+        self.flush()
+        albumCountMap = self.albumCountMap
+        trackCountMap = self.trackCountMap
+        artistCountMap = self.artistCountMap
+        alArtCountMap = self.alArtCountMap
+        with CSVFile(join(output, 'album.csv')) as al:
+            al.write(_("Name"), _("Album artists"), _("Artists"), _("Record count"), _("Play count"), _("Play duration"), _("Play duration") + _("(seconds)"), _("Duration"), _("Duration") + _("(seconds)"), _("Year"), _("Publish date"), _("Publisher"), _("Item id"))  # noqa: E501
+            for album in albumCountMap:
+                if album not in albumMap:
+                    continue
+                item = albumMap[album]
+                album_artists = ''
+                artists = ''
+                count = albumCountMap[album]
+                duration = None
+                year = None
+                publisher = None
+                itemId = None
+                if 'type' in item:
+                    album_artists = item['AlbumArtists']
+                    artists = item['Artists']
+                    duration = item['RunTimeTicks'] / TIME_BASE
+                    year = item['ProductionYear']
+                    date = item['PremiereDate']
+                    publisher = item['Studios']
+                    itemId = item['PresentationUniqueKey']
+                else:
+                    album_artists = item['album_artists']
+                    year = item['year']
+                    date = item['date']
+                    publisher = item['publisher']
+                if year and date:
+                    if date.endswith("-01-01 00:00:00"):
+                        date = None
+                al.write(album, album_artists, artists, count['count'], count['play_count'], format_duration(count['duration']), count['duration'], format_duration(duration), duration, year, date, publisher, itemId)  # noqa: E501
+        with CSVFile(join(output, 'track.csv')) as tr:
+            tr.write(_("Name"), _("Artists"), _("Record count"), _("Play count"), _("Play duration"), _("Play duration") + _("(seconds)"), _("Duration"), _("Duration") + _("(seconds)"), _("Album"), _("Album artists"), _("Genres"), _("Track no"), _("Disc no"), _("Year"), _("Publish date"), _("Publisher"), _("Item id"))  # noqa: E501
+            for itemId in trackCountMap:
                 item = itemMap[itemId]
+                count = trackCountMap[itemId]
                 name = ''
                 artists = ''
                 album = ''
                 album_artists = ''
-                original_item_id = i['ItemId']
-                play_duration = i['PlayDuration']
+                genres = ''
+                track = None
+                disc = None
+                year = None
+                date = None
+                publisher = None
                 duration = None
-                play_count = 1
                 if 'type' in item:
                     name = item['Name']
                     artists = item['Artists']
                     album = item['Album']
                     album_artists = item['AlbumArtists']
-                    duration = item['RunTimeTicks'] / 10_000_000
-                    play_count = floor(play_duration / duration)
-                    extrad = play_duration % duration
-                    if extrad > 60 or extrad > duration * 0.95:
-                        play_count += 1
+                    genres = item['Genres']
+                    track = item['IndexNumber']
+                    disc = item['ParentIndexNumber']
+                    duration = item['RunTimeTicks'] / TIME_BASE
+                    year = item['ProductionYear']
+                    date = item['PremiereDate']
+                    publisher = item['Studios']
                 else:
                     it = ITEMNAME_PATTERN.match(item['ItemName']).groupdict()
                     name = it['track']
@@ -275,161 +612,479 @@ def generate_audio_report(pdb: PlaybackReportingDb, itemMap, rowMap, albumMap,
                         album = it['album']
                     if it['album_artist'] != NOT_KNOWN:
                         album_artists = it['album_artist']
-                his.write(rowid, date, time, name, artists, album, album_artists, format_duration(duration), duration, original_item_id, itemId, format_duration(play_duration), play_duration, i['ItemName'], i['ClientName'], i['DeviceName'], i['PlaybackMethod'], play_count)  # noqa: E501
-                if album:
-                    if album in albumCountMap:
-                        tmp = albumCountMap[album]
-                        tmp['count'] += 1
-                        tmp['play_count'] += play_count
-                        tmp['duration'] += play_duration
-                    else:
-                        albumCountMap[album] = {'count': 1,
-                                                'play_count': play_count,
-                                                'duration': play_duration}
-                if itemId in trackCountMap:
-                    tmp = trackCountMap[itemId]
-                    tmp['count'] += 1
-                    tmp['play_count'] += play_count
-                    tmp['duration'] += play_duration
-                else:
-                    trackCountMap[itemId] = {'count': 1,
-                                             'play_count': play_count,
-                                             'duration': play_duration}
-                if artists:
-                    for art in artists.split("|"):
-                        ar = art.strip()
-                        if ar in artistCountMap:
-                            tmp = artistCountMap[ar]
-                            tmp['count'] += 1
-                            tmp['play_count'] += play_count
-                            tmp['duration'] += play_duration
-                        else:
-                            artistCountMap[ar] = {'count': 1,
-                                                  'play_count': play_count,
-                                                  'duration': play_duration}
-                if album_artists:
-                    if 'type' in item:
-                        arts = album_artists.split("|")
-                    else:
-                        arts = album_artists.split(",")
-                    for art in arts:
-                        ar = art.strip()
-                        if ar in alArtCountMap:
-                            tmp = alArtCountMap[ar]
-                            tmp['count'] += 1
-                            tmp['play_count'] += play_count
-                            tmp['duration'] += play_duration
-                        else:
-                            alArtCountMap[ar] = {'count': 1,
-                                                 'play_count': play_count,
-                                                 'duration': play_duration}
-            offset += len(data)
-            data = pdb.get_activitys(offset, itemType='Audio', userId=userId,
-                                     startTime=startTime, endTime=endTime)
-    with CSVFile(join(output, 'album.csv')) as al:
-        al.write(_("Name"), _("Album artists"), _("Artists"), _("Record count"), _("Play count"), _("Play duration"), _("Play duration") + _("(seconds)"), _("Duration"), _("Duration") + _("(seconds)"), _("Year"), _("Publish date"), _("Publisher"), _("Item id"))  # noqa: E501
-        for album in albumCountMap:
-            if album not in albumMap:
-                continue
-            item = albumMap[album]
-            album_artists = ''
-            artists = ''
-            count = albumCountMap[album]
-            duration = None
-            year = None
-            publisher = None
-            itemId = None
-            if 'type' in item:
-                album_artists = item['AlbumArtists']
-                artists = item['Artists']
-                duration = item['RunTimeTicks'] / TIME_BASE
-                year = item['ProductionYear']
-                date = item['PremiereDate']
-                publisher = item['Studios']
-                itemId = item['PresentationUniqueKey']
-            else:
-                album_artists = item['album_artists']
-                year = item['year']
-                date = item['date']
-                publisher = item['publisher']
-            if year and date:
-                if date.endswith("-01-01 00:00:00"):
-                    date = None
-            al.write(album, album_artists, artists, count['count'], count['play_count'], format_duration(count['duration']), count['duration'], format_duration(duration), duration, year, date, publisher, itemId)  # noqa: E501
-    with CSVFile(join(output, 'track.csv')) as tr:
-        tr.write(_("Name"), _("Artists"), _("Record count"), _("Play count"), _("Play duration"), _("Play duration") + _("(seconds)"), _("Duration"), _("Duration") + _("(seconds)"), _("Album"), _("Album artists"), _("Genres"), _("Track no"), _("Disc no"), _("Year"), _("Publish date"), _("Publisher"), _("Item id"))  # noqa: E501
-        for itemId in trackCountMap:
-            item = itemMap[itemId]
-            count = trackCountMap[itemId]
-            name = ''
-            artists = ''
-            album = ''
-            album_artists = ''
-            genres = ''
-            track = None
-            disc = None
-            year = None
-            date = None
-            publisher = None
-            duration = None
-            if 'type' in item:
-                name = item['Name']
-                artists = item['Artists']
-                album = item['Album']
-                album_artists = item['AlbumArtists']
-                genres = item['Genres']
-                track = item['IndexNumber']
-                disc = item['ParentIndexNumber']
-                duration = item['RunTimeTicks'] / TIME_BASE
-                year = item['ProductionYear']
-                date = item['PremiereDate']
-                publisher = item['Studios']
-            else:
-                it = ITEMNAME_PATTERN.match(item['ItemName']).groupdict()
-                name = it['track']
-                if it['album'] != NOT_KNOWN:
-                    album = it['album']
-                if it['album_artist'] != NOT_KNOWN:
-                    album_artists = it['album_artist']
-            if year and date:
-                if date.endswith("-01-01 00:00:00"):
-                    date = None
-            tr.write(name, artists, count['count'], count['play_count'], format_duration(count['duration']), count['duration'], format_duration(duration), duration, album, album_artists, genres, track, disc, year, date, publisher, itemId)  # noqa: E501
-    with CSVFile(join(output, 'artist.csv')) as ar:
-        ar.write(_("Name"), _("Record count"), _("Play count"), _("Play duration"), _("Play duration") + _("(seconds)"))  # noqa: E501
-        for artist in artistCountMap:
-            count = artistCountMap[artist]
-            ar.write(artist, count['count'], count['play_count'], format_duration(count['duration']), count['duration'])  # noqa: E501
-    with CSVFile(join(output, 'album_artist.csv')) as alAr:
-        alAr.write(_("Name"), _("Record count"), _("Play count"), _("Play duration"), _("Play duration") + _("(seconds)"))  # noqa: E501
-        for artist in alArtCountMap:
-            count = alArtCountMap[artist]
-            alAr.write(artist, count['count'], count['play_count'], format_duration(count['duration']), count['duration'])  # noqa: E501
-
-
-def fix_audio_report_library(pdb: PlaybackReportingDb):
-    clients = pdb.get_client_devices()
-    for client in clients:
-        clientName = client['ClientName']
-        deviceName = client['DeviceName']
-        prev = None
-        offset = 0
-        data = pdb.get_activitys(offset, itemType='Audio',
-                                 clientName=clientName,
-                                 deviceName=deviceName)
-        while len(data) > 0:
-            for i in data:
-                if prev is None:
-                    prev = i
-                    continue
-                delta = ceil(parse_time(
-                    i['DateCreated']) - parse_time(prev['DateCreated']))
-                dur = prev['PlayDuration']
-                if delta < dur - 1:
-                    print(f'Change song(id={prev["rowid"]}) play duration from {dur} to {delta}')   # noqa: E501
-                    pdb.update_playduration(prev["rowid"], delta)
-                prev = i
-            offset += len(data)
-            data = pdb.get_activitys(offset, itemType='Audio',
-                                     clientName=clientName,
-                                     deviceName=deviceName)
+                if year and date:
+                    if date.endswith("-01-01 00:00:00"):
+                        date = None
+                tr.write(name, artists, count['count'], count['play_count'], format_duration(count['duration']), count['duration'], format_duration(duration), duration, album, album_artists, genres, track, disc, year, date, publisher, itemId)  # noqa: E501
+        with CSVFile(join(output, 'artist.csv')) as ar:
+            ar.write(_("Name"), _("Record count"), _("Play count"), _("Play duration"), _("Play duration") + _("(seconds)"))  # noqa: E501
+            for artist in artistCountMap:
+                count = artistCountMap[artist]
+                ar.write(artist, count['count'], count['play_count'], format_duration(count['duration']), count['duration'])  # noqa: E501
+        with CSVFile(join(output, 'album_artist.csv')) as alAr:
+            alAr.write(_("Name"), _("Record count"), _("Play count"), _("Play duration"), _("Play duration") + _("(seconds)"))  # noqa: E501
+            for artist in alArtCountMap:
+                count = alArtCountMap[artist]
+                alAr.write(artist, count['count'], count['play_count'], format_duration(count['duration']), count['duration'])  # noqa: E501
+
+
+def write_history(output: str, chunks, pipelined: bool = False):
+    """Write ``history.csv`` from lists of rows, encoded and written by a
+    writer thread if ``pipelined``."""
+    with CSVFile(join(output, "history.csv")) as his:
+        write_history_header(his)
+        if not pipelined:
+            his.write_rows(chain.from_iterable(chunks))
+            return
+        with ThreadedWriter(lambda c: his.write_rows(chain.from_iterable(c))) as writer:  # noqa: E501
+            for chunk in chunks:
+                writer.put(chunk)
+
+
+def generate_audio_report(pdb: PlaybackReportingDb, itemMap, idMap, albumMap,
+                          output: str, userId: str = None,
+                          startTime: float = None, endTime: float = None,
+                          columnar: bool = False, pipelined: bool = False):
+    """Write ``history.csv`` and the summaries of the plays of ``userId``
+    from ``startTime`` until before ``endTime``.
+
+    With ``columnar`` (NumPy required), play counts are computed for a whole
+    page of rows and the summaries are grouped sums over all plays.
+
+    With ``pipelined``, pages are fetched by a reader thread and
+    ``history.csv`` is written by a writer thread while the rows are
+    aggregated in this thread; bounded queues between them keep memory
+    use constant."""
+    makedirs(output, exist_ok=True)
+    if columnar:
+        return _generate_audio_report_columnar(
+            pdb, itemMap, idMap, albumMap, output, userId, startTime,
+            endTime, pipelined)
+    report = AudioReport(output, False)
+    pages = iter_activity_pages(pdb, pipelined, itemType='Audio',
+                                userId=userId, startTime=startTime,
+                                endTime=endTime)
+
+    def chunks():
+        for page in pages:
+            chunk = []
+            for i in page:
+                rec = AudioRecord(i, itemMap, idMap)
+                report.add(rec)
+                chunk.append(rec.row)
+            yield chunk
+    with metrics.stage('generate_audio_report', output=output):
+        write_history(output, chunks(), pipelined)
+        report.write(itemMap, albumMap)
+
+
+def _generate_audio_report_columnar(pdb: PlaybackReportingDb, itemMap,
+                                    idMap, albumMap, output: str,
+                                    userId: str = None,
+                                    startTime: float = None,
+                                    endTime: float = None,
+                                    pipelined: bool = False):
+    from .columnar import ItemIndex
+    items = ItemIndex()
+    report = AudioReport(output, False, items)
+    columns = report.columns
+    pages = iter_activity_pages(pdb, pipelined, itemType='Audio',
+                                userId=userId, startTime=startTime,
+                                endTime=endTime,
+                                batchSize=COLUMNAR_CHUNK_ROWS)
+
+    def chunks():
+        for page in pages:
+            itemIds = [idMap[i['ItemId']] for i in page]
+            idx = array('q')
+            for itemId in itemIds:
+                n = items.index.get(itemId)
+                if n is None:
+                    n = items.add(itemId, get_audio_info(itemMap[itemId]))
+                idx.append(n)
+            play_durations = array('q', [i['PlayDuration'] for i in page])
+            play_counts = array('q', items.play_counts(idx, play_durations).tobytes())  # noqa: E501
+            columns.extend(idx, play_counts, play_durations)
+            infos = items.infos
+            yield [history_row(i, itemId, infos[n], play_count) for i, itemId, n, play_count in zip(page, itemIds, idx, play_counts)]  # noqa: E501
+    with metrics.stage('generate_audio_report', output=output,
+                       engine='numpy'):
+        write_history(output, chunks(), pipelined)
+        report.write(itemMap, albumMap)
+
+
+def period_output(output: str, period) -> str:
+    if output is None or period is None:
+        return output
+    if isinstance(period, YearMonth):
+        return join(output, str(period.year), str(period.month).rjust(2, '0'))  # noqa: E501
+    return join(output, str(period))
+
+
+def period_to_str(period) -> str:
+    if period is None:
+        return 'all'
+    if isinstance(period, YearMonth):
+        return f'{period.year}-{str(period.month).rjust(2, "0")}'
+    return str(period)
+
+
+def str_to_period(s: str):
+    if s == 'all':
+        return None
+    if '-' in s:
+        return parse_year_month(s)
+    return int(s)
+
+
+def load_audio_durations(pdb: PlaybackReportingDb, itemMap, idMap):
+    """Load the durations of the items of ``idMap`` into ``pdb`` for
+    :meth:`PlaybackReportingDb.iter_activity_groups`, once per maps."""
+    def durations():
+        for activityId, itemId in idMap.items():
+            duration = get_audio_info(itemMap[itemId])[4]
+            if duration:
+                yield activityId, duration
+    pdb.load_item_durations(durations(), (id(itemMap), id(idMap), len(idMap)))  # noqa: E501
+
+
+def generate_audio_summary(pdb: PlaybackReportingDb, itemMap, idMap,
+                           albumMap, output: str, userId: str = None,
+                           startTime: float = None, endTime: float = None):
+    """Same as :func:`generate_audio_report` without ``history.csv``.
+
+    Plays are grouped by item and their play counts summed in SQLite, so
+    only one row per item is moved into Python."""
+    report = AudioReport(output, False)
+    with metrics.stage('generate_audio_summary', output=output):
+        load_audio_durations(pdb, itemMap, idMap)
+        for g in pdb.iter_activity_groups(itemType='Audio', userId=userId,
+                                          startTime=startTime,
+                                          endTime=endTime):
+            itemId = idMap[g['ItemId']]
+            info = get_audio_info(itemMap[itemId])
+            report.add_plays(itemId, info[2], info[5], info[6],
+                             g['PlayCount'], g['PlayDuration'], g['count'])
+        report.write(itemMap, albumMap)
+
+
+_worker = None
+
+
+def _get_report_generator(summaryOnly: bool, columnar: bool,
+                          pipelined: bool):
+    if summaryOnly:
+        return generate_audio_summary
+    if columnar or pipelined:
+        return partial(generate_audio_report, columnar=columnar,
+                       pipelined=pipelined)
+    return generate_audio_report
+
+
+def _init_report_worker(dbPath: str, itemMap, idMap, albumMap,
+                        summaryOnly: bool, columnar: bool, pipelined: bool):
+    global _worker
+    _worker = (PlaybackReportingDb(dbPath, True), itemMap, idMap, albumMap,
+               _get_report_generator(summaryOnly, columnar, pipelined))
+
+
+def _run_report_worker(args):
+    pdb, itemMap, idMap, albumMap, generate = _worker
+    generate(pdb, itemMap, idMap, albumMap, *args)
+
+
+def generate_audio_report_tasks(pdb: PlaybackReportingDb, dbPath: str,
+                                itemMap, idMap, albumMap,
+                                tasks: List[tuple], jobs: int = 1,
+                                summaryOnly: bool = False,
+                                columnar: bool = False,
+                                pipelined: bool = False):
+    """Run :func:`generate_audio_report` for every
+    ``(output, userId, startTime, endTime)`` in ``tasks``, or
+    :func:`generate_audio_summary` with ``summaryOnly``.
+
+    With ``jobs`` > 1 the reports are generated in a process pool; each
+    worker opens its own read-only connection to ``dbPath``."""
+    generate = _get_report_generator(summaryOnly, columnar, pipelined)
+    if jobs <= 1 or len(tasks) <= 1:
+        for t in tasks:
+            generate(pdb, itemMap, idMap, albumMap, *t)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(min(jobs, len(tasks)), initializer=_init_report_worker, initargs=(dbPath, itemMap, idMap, albumMap, summaryOnly, columnar, pipelined)) as ex:  # noqa: E501
+        for _re in ex.map(_run_report_worker, tasks):
+            pass
+
+
+class AudioReportSet:
+    """All time, year and month reports of many users filled by one scan.
+
+    Periods a play falls into but which were not added beforehand (e.g. a
+    play that is in the next month in local time) are created on demand,
+    subject to ``years``. With ``columnar`` the reports sum their plays
+    with NumPy. Without ``keepHistory`` no history rows are kept."""
+    def __init__(self, utc: bool = False, years: List[int] = None,
+                 users: List[str] = None, columnar: bool = False,
+                 keepHistory: bool = True):
+        self.utc = utc
+        self.years = years if years else None
+        self.users = sorted(users) if users else []
+        self.keepHistory = keepHistory
+        self._items = None
+        if columnar:
+            from .columnar import ItemIndex
+            self._items = ItemIndex()
+        self._outputs = {}
+        self._reports = {}
+        self._checksum = None
+
+    def add_user(self, userId: str, output: str = None):
+        """Add a user and its all time report. Without ``output`` the
+        reports can not be written."""
+        self._outputs[userId] = output
+        self._reports[userId] = {None: AudioReport(output, self.keepHistory, self._items)}  # noqa: E501
+
+    def add_period(self, userId: str, period):
+        """Add a year (int) or month (:class:`YearMonth`) report."""
+        reports = self._reports[userId]
+        if period not in reports:
+            output = period_output(self._outputs[userId], period)
+            reports[period] = AudioReport(output, self.keepHistory,
+                                          self._items)
+        return reports[period]
+
+    def get_users(self) -> List[str]:
+        return list(self._reports)
+
+    def get_periods(self, userId: str):
+        """Periods of the reports of ``userId``, None for all time."""
+        return list(self._reports.get(userId, ()))
+
+    def get_report(self, userId: str, period=None):
+        reports = self._reports.get(userId)
+        return reports.get(period) if reports is not None else None
+
+    def add(self, userId: str, rec: AudioRecord):
+        reports = self._reports.get(userId)
+        if reports is None:
+            return
+        reports[None].add(rec)
+        # DateCreated is stored in UTC, so its text gives the UTC date.
+        created = rec.created if self.utc else rec.date
+        year = int(created[:4])
+        if self.years and year not in self.years:
+            return
+        if year in reports:
+            reports[year].add(rec)
+        else:
+            self.add_period(userId, year).add(rec)
+        month = YearMonth(year, int(created[5:7]))
+        if month in reports:
+            reports[month].add(rec)
+        else:
+            self.add_period(userId, month).add(rec)
+
+    def flush(self):
+        """Write the buffered history rows of all reports, so only the
+        counters stay in memory."""
+        for userId in self._reports:
+            reports = self._reports[userId]
+            for period in reports:
+                if reports[period].history:
+                    reports[period].flush()
+
+    def write(self, itemMap, albumMap):
+        for userId in self._reports:
+            reports = self._reports[userId]
+            for period in reports:
+                reports[period].write(itemMap, albumMap)
+
+    def load_state(self, path: str, pdb: PlaybackReportingDb, itemMap):
+        """Load aggregates saved by :meth:`save_state`.
+
+        Returns the last processed ROWID, or None if there is no usable
+        state and all reports need to be rebuilt."""
+        if not exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='UTF-8') as f:
+                data = load_json(f)
+            version = data['version']
+            if version > 1:
+                t = _("Unsupported version: ")
+                raise NotImplementedError(f'{t}{version}')
+        except Exception:
+            from traceback import print_exc
+            print_exc()
+            print(_("Failed to load report state."))
+            return None
+        lastRowId = data['last_rowid']
+        reason = None
+        if data['utc'] != self.utc or data['years'] != self.years or data['users'] != self.users:  # noqa: E501
+            reason = _("Report options changed.")
+        elif data['checksum'] != list(pdb.get_activity_checksum('Audio', lastRowId)):  # noqa: E501
+            reason = _("Old playback activities changed.")
+        else:
+            for userId in data['reports']:
+                udata = data['reports'][userId]
+                if self._outputs.get(userId) != udata['output']:
+                    reason = _("Report users changed.")
+                    break
+                for p in udata['periods']:
+                    count = udata['periods'][p]
+                    output = period_output(udata['output'], str_to_period(p))  # noqa: E501
+                    if not exists(join(output, 'history.csv')):
+                        reason = _("Report files are missing.")
+                        break
+                    if read_last_rowid(join(output, 'history.csv')) != count.get('last_rowid'):  # noqa: E501
+                        reason = _("Report files changed.")
+                        break
+                    for itemId in count['tracks']:
+                        if itemId not in itemMap:
+                            reason = _("Library items changed.")
+                            break
+                    if reason:
+                        break
+                if reason:
+                    break
+        if reason:
+            print(reason + " " + _("Rebuilding all reports."))
+            return None
+        for userId in data['reports']:
+            periods = data['reports'][userId]['periods']
+            for p in periods:
+                count = periods[p]
+                report = self.add_period(userId, str_to_period(p))
+                report.append = True
+                report.lastRowId = count.get('last_rowid')
+                report.albumCountMap = count['albums']
+                report.trackCountMap = count['tracks']
+                report.artistCountMap = count['artists']
+                report.alArtCountMap = count['album_artists']
+        self._checksum = (lastRowId, data['checksum'])
+        return lastRowId
+
+    def save_state(self, path: str, pdb: PlaybackReportingDb,
+                   lastRowId: int):
+        """Save the aggregates of the activities up to ``lastRowId``.
+
+        The checksum verified by :meth:`load_state` is extended with the
+        new activities only."""
+        if self._checksum is None:
+            checksum = pdb.get_activity_checksum('Audio', lastRowId)
+        else:
+            rowId, checksum = self._checksum
+            checksum = add_activity_checksums(checksum, pdb.get_activity_checksum('Audio', lastRowId, rowId))  # noqa: E501
+        reports = {}
+        for userId in self._reports:
+            periods = {}
+            for period in self._reports[userId]:
+                report = self._reports[userId][period]
+                periods[period_to_str(period)] = {
+                    'last_rowid': report.lastRowId,
+                    'albums': report.albumCountMap,
+                    'tracks': report.trackCountMap,
+                    'artists': report.artistCountMap,
+                    'album_artists': report.alArtCountMap,
+                }
+            reports[userId] = {'output': self._outputs[userId],
+                               'periods': periods}
+        data = {'version': 1, 'last_rowid': lastRowId, 'utc': self.utc,
+                'years': self.years, 'users': self.users,
+                'checksum': list(checksum),
+                'reports': reports}
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='UTF-8') as f:
+            dump_json(data, f, ensure_ascii=False, separators=(',', ':'))
+        replace(tmp, path)
+        self._checksum = (lastRowId, list(checksum))
+
+
+def read_last_rowid(path: str):
+    """ROWID of the last row of a ``history.csv``, None if it has no rows
+    or the last row can not be read."""
+    with open(path, 'rb') as f:
+        f.seek(0, SEEK_END)
+        f.seek(max(f.tell() - 65536, 0))
+        lines = f.read().split(b'\r\n')
+    if len(lines) < 2:
+        return None
+    rowId = lines[-2].split(b',', 1)[0]
+    return int(rowId) if rowId.isdigit() else None
+
+
+def remove_report_state(path: str):
+    """Remove the state of incremental reports, e.g. after their history
+    files were rewritten."""
+    if exists(path):
+        remove(path)
+
+
+class AudioReportAggregator(Aggregator):
+    """Fill an :class:`AudioReportSet` from the audio activities of a
+    :func:`run_aggregators` scan."""
+    columns = ('DateCreated', 'UserId', 'ItemId', 'ItemName',
+               'PlaybackMethod', 'ClientName', 'DeviceName', 'PlayDuration')
+    itemTypes = ('Audio',)
+
+    def __init__(self, reports: AudioReportSet, itemMap, idMap, albumMap):
+        self.reports = reports
+        self.itemMap = itemMap
+        self.idMap = idMap
+        self.albumMap = albumMap
+
+    def add(self, row):
+        self.reports.add(row['UserId'],
+                         AudioRecord(row, self.itemMap, self.idMap))
+
+    def flush(self):
+        self.reports.flush()
+
+    def finish(self):
+        self.reports.write(self.itemMap, self.albumMap)
+
+
+@measure('generate_audio_reports')
+def generate_audio_reports(pdb: PlaybackReportingDb, itemMap, idMap,
+                           albumMap, reports: AudioReportSet,
+                           statePath: str = None, pipelined: bool = False,
+                           incremental: bool = False):
+    """Generate all reports in ``reports`` with one scan.
+
+    With ``statePath``, the aggregates are saved there afterwards. With
+    ``incremental`` as well, only activities newer than the saved state are
+    scanned and appended to the existing reports. With ``pipelined``,
+    activities are fetched by a reader thread."""
+    afterRowId = None
+    maxRowId = pdb.get_max_rowid()
+    if statePath is not None and incremental:
+        afterRowId = reports.load_state(statePath, pdb, itemMap)
+    run_aggregators(pdb, [AudioReportAggregator(reports, itemMap, idMap, albumMap)], afterRowId, maxRowId, pipelined)  # noqa: E501
+    if statePath is not None:
+        reports.save_state(statePath, pdb, maxRowId)
+
+
+@measure('fix_audio_report_library')
+def fix_audio_report_library(pdb: PlaybackReportingDb, dryRun: str = None):
+    """Shorten play durations which are longer than the time until the next
+    play on the same client and device.
+
+    All rows are checked with one window query and the changes are applied
+    in one transaction. With ``dryRun``, the planned changes are written to
+    that CSV file instead."""
+    changes = []
+    for i in pdb.iter_next_plays('Audio'):
+        delta = ceil(parse_time(
+            i['NextDateCreated']) - parse_time(i['DateCreated']))
+        dur = i['PlayDuration']
+        if delta < dur - 1:
+            changes.append((i['rowid'], dur, delta, i))
+    if dryRun is not None:
+        with CSVFile(dryRun) as f:
+            f.write(_("Id"), _("Date"), _("Client name"), _("Device name"), _("Play duration") + _("(seconds)"), _("New play duration") + _("(seconds)"))  # noqa: E501
+            f.write_rows((rowid, i['DateCreated'], i['ClientName'], i['DeviceName'], dur, delta) for rowid, dur, delta, i in changes)  # noqa: E501
+        return changes
+    for rowid, dur, delta, i in changes:
+        print(f'Change song(id={rowid}) play duration from {dur} to {delta}')   # noqa: E501
+    pdb.update_playdurations([(c[0], c[2]) for c in changes])
+    return changes
@@ -1,54 +1,92 @@
+import sqlite3
+from json import dumps as dump_json, loads as load_json
 from os import makedirs
 from os.path import exists, join
 from typing import Dict, Any
-from yaml import dump as dumpyaml, load as loadyaml
-try:
-    from yaml import CSafeDumper as SafeDumper, CSafeLoader as SafeLoader
-except ImportError:
-    from yaml import SafeDumper, SafeLoader
 from . import _
+from .config import load_yaml
+from .metrics import connection_factory
+
+
+VERSION = 2
 
 
 class IdRelativeCache:
+    """Relation between item ids which are no longer in the library and
+    the items they were replaced by.
+
+    Entries are kept in ``id_relative_cache.db`` and every change is
+    committed immediately, so answers given in :class:`AudioSelector` are
+    not lost if the program is interrupted. An old
+    ``id_relative_cache.yaml`` is imported on first use."""
     def __init__(self, output_dir: str):
         makedirs(output_dir, exist_ok=True)
-        self._path = join(output_dir, 'id_relative_cache.yaml')
-        self._data = {}
-        if exists(self._path):
+        self.path = join(output_dir, 'id_relative_cache.db')
+        self._yaml_path = join(output_dir, 'id_relative_cache.yaml')
+        self._db = sqlite3.connect(self.path, factory=connection_factory())
+        self._closed = False
+        self._db.execute("CREATE TABLE IF NOT EXISTS config (k TEXT PRIMARY KEY, v TEXT);")  # noqa: E501
+        self._db.execute("CREATE TABLE IF NOT EXISTS cache (id TEXT PRIMARY KEY, value TEXT NOT NULL);")  # noqa: E501
+        self._db.commit()
+        version = self._get_config('version')
+        if version is None:
+            self._migrate()
+        elif int(version) > VERSION:
+            self.close()
+            t = _("Unsupported version: ")
+            raise NotImplementedError(f'{t}{version}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tp, val, trace):
+        self.close()
+
+    def _get_config(self, key: str):
+        cur = self._db.execute("SELECT v FROM config WHERE k = ?;", [key])
+        re = cur.fetchone()
+        return re[0] if re is not None else None
+
+    def _migrate(self):
+        data = {}
+        migrated = True
+        if exists(self._yaml_path):
             try:
-                with open(self._path, "r", encoding="UTF-8") as f:
-                    data = loadyaml(f, SafeLoader)
-                version = data['version']
+                with open(self._yaml_path, "r", encoding="UTF-8") as f:
+                    d = load_yaml(f)
+                version = d['version']
                 if version > 1:
                     t = _("Unsupported version: ")
                     raise NotImplementedError(f'{t}{version}')
-                self._data = data['data']
+                data = d['data']
             except Exception:
                 from traceback import print_exc
                 print_exc()
                 print(_("Failed to load cache."))
-        self._closed = False
-
-    def __enter__(self):
-        return self
-
-    def __exit__(self, tp, val, trace):
-        self.close()
+                migrated = False
+        with self._db:
+            self._db.executemany("INSERT OR IGNORE INTO cache VALUES (?, ?);", [(k, dump_json(data[k], ensure_ascii=False)) for k in data])  # noqa: E501
+            if migrated:
+                self._db.execute("INSERT OR REPLACE INTO config VALUES ('version', ?);", [str(VERSION)])  # noqa: E501
 
     def close(self):
         if self._closed:
             return
-        with open(self._path, "w", encoding='UTF-8') as f:
-            dumpyaml({'version': 1, 'data': self._data}, f, SafeDumper,
-                     allow_unicode=True)
+        self._db.close()
         self._closed = True
 
     def get(self, oldId: str):
-        return self._data[oldId] if oldId in self._data else None
+        cur = self._db.execute("SELECT value FROM cache WHERE id = ?;",
+                               [oldId])
+        re = cur.fetchone()
+        return load_json(re[0]) if re is not None else None
 
     def set(self, oldId: str, newId: str, data: Dict[str, Any]):
-        self._data[oldId] = {k: data[k] for k in data}
-        self._data[oldId]['id'] = newId
+        value = {k: data[k] for k in data}
+        value['id'] = newId
+        self.set_value(oldId, value)
 
     def set_value(self, oldId: str, value):
-        self._data[oldId] = value
+        with self._db:
+            self._db.execute("INSERT OR REPLACE INTO cache VALUES (?, ?);",
+                             [oldId, dump_json(value, ensure_ascii=False)])
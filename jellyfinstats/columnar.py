@@ -0,0 +1,137 @@
+"""Columnar aggregation of audio plays.
+
+Plays are collected as integer columns (item index, play count, play
+duration) and summed per track, album, artist and album artist with grouped
+reductions in NumPy. NumPy is optional, :data:`AVAILABLE` tells whether it
+is installed."""
+from array import array
+from math import nan
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+AVAILABLE = np is not None
+
+
+class ItemIndex:
+    """Dense index of the played items of ``itemMap`` and their
+    :func:`jellyfinstats.audio.get_audio_info` tuples."""
+    def __init__(self):
+        self.index = {}
+        self.ids = []
+        self.infos = []
+        self.durations = array('d')
+
+    def add(self, itemId: str, info) -> int:
+        idx = len(self.ids)
+        self.index[itemId] = idx
+        self.ids.append(itemId)
+        self.infos.append(info)
+        self.durations.append(info[4] if info[4] else nan)
+        return idx
+
+    def get(self, itemId: str, info) -> int:
+        idx = self.index.get(itemId)
+        return self.add(itemId, info) if idx is None else idx
+
+    def play_counts(self, idx: array, play_durations: array):
+        """Vectorized :func:`jellyfinstats.audio.get_play_count`. Items
+        without a (non-zero) duration count as one play."""
+        dur = np.frombuffer(self.durations, dtype=np.float64)[np.frombuffer(idx, dtype=np.int64)]  # noqa: E501
+        pd = np.frombuffer(play_durations, dtype=np.int64).astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            count = np.floor(pd / dur)
+            extra = np.remainder(pd, dur)
+            count += (extra > 60) | (extra > dur * 0.95)
+        return np.where(np.isnan(dur), 1, count).astype(np.int64)
+
+
+class ColumnarCounts:
+    """Plays of one report kept as columns until :meth:`reduce`.
+
+    ``PlayDuration`` is an integer column, so every sum is an integer and
+    the totals do not depend on the order of summation (sums are done in
+    float64, which is exact below 2 ** 53)."""
+    def __init__(self, items: ItemIndex):
+        self.items = items
+        self.clear()
+
+    def clear(self):
+        self.idx = array('q')
+        self.play_count = array('q')
+        self.play_duration = array('q')
+
+    def add(self, idx: int, play_count: int, play_duration: int):
+        self.idx.append(idx)
+        self.play_count.append(play_count)
+        self.play_duration.append(play_duration)
+
+    def extend(self, idx: array, play_count: array, play_duration: array):
+        self.idx.extend(idx)
+        self.play_count.extend(play_count)
+        self.play_duration.extend(play_duration)
+
+    def reduce(self, add_count, albumCountMap, trackCountMap, artistCountMap,
+               alArtCountMap):
+        """Sum the collected plays into the count maps with ``add_count``.
+
+        New keys are added in the order of their first play, like when
+        every row is added to the maps one by one."""
+        if not len(self.idx):
+            return
+        items = self.items
+        seen, first, local = np.unique(np.frombuffer(self.idx, dtype=np.int64), return_index=True, return_inverse=True)  # noqa: E501
+        n = len(seen)
+        counts = np.bincount(local, minlength=n)
+        play_counts = np.bincount(local, np.frombuffer(self.play_count, dtype=np.int64), n)  # noqa: E501
+        durations = np.bincount(local, np.frombuffer(self.play_duration, dtype=np.int64), n)  # noqa: E501
+        totals = np.stack((counts, play_counts, durations), 1)
+        # Local indices in the order of the first play of each item.
+        order = np.argsort(first, kind='stable').tolist()
+        seen = seen.tolist()
+        itemTotals = totals.astype(np.int64).tolist()
+        albums = {}
+        albumOf = []
+        artists = {}
+        artistPairs = ([], [])
+        alArts = {}
+        alArtPairs = ([], [])
+        for i in order:
+            info = items.infos[seen[i]]
+            count, play_count, duration = itemTotals[i]
+            add_count(trackCountMap, items.ids[seen[i]], play_count, duration,
+                      count)
+            album = info[2]
+            if album:
+                albumOf.append((i, albums.setdefault(album, len(albums))))
+            for art in info[5]:
+                art = art.strip()
+                artistPairs[0].append(i)
+                artistPairs[1].append(artists.setdefault(art, len(artists)))
+            for art in info[6]:
+                art = art.strip()
+                alArtPairs[0].append(i)
+                alArtPairs[1].append(alArts.setdefault(art, len(alArts)))
+        if albumOf:
+            a = np.array(albumOf, dtype=np.int64)
+            self._reduce_groups(add_count, albumCountMap, albums, totals,
+                                a[:, 0], a[:, 1])
+        self._reduce_groups(add_count, artistCountMap, artists, totals,
+                            *artistPairs)
+        self._reduce_groups(add_count, alArtCountMap, alArts, totals,
+                            *alArtPairs)
+        self.clear()
+
+    @staticmethod
+    def _reduce_groups(add_count, countMap, keys, totals, itemIdx, groupIdx):
+        if not keys:
+            return
+        itemIdx = np.asarray(itemIdx, dtype=np.int64)
+        groupIdx = np.asarray(groupIdx, dtype=np.int64)
+        n = len(keys)
+        t = totals[itemIdx]
+        sums = np.stack([np.bincount(groupIdx, t[:, c], n) for c in range(3)], 1)  # noqa: E501
+        for key, (count, play_count, duration) in zip(keys, sums.astype(np.int64).tolist()):  # noqa: E501
+            add_count(countMap, key, play_count, duration, count)
@@ -4,18 +4,24 @@ try:
 except ImportError:
     cached_property = property
 from os.path import join
-from yaml import load as loadyaml
-try:
-    from yaml import CSafeLoader as SafeLoader
-except ImportError:
-    from yaml import SafeLoader
 from . import _
 
 
+def load_yaml(f):
+    """Parse a YAML file. PyYAML is imported on first use, so commands
+    which read no YAML do not pay for it."""
+    from yaml import load as loadyaml
+    try:
+        from yaml import CSafeLoader as SafeLoader
+    except ImportError:
+        from yaml import SafeLoader
+    return loadyaml(f, Loader=SafeLoader)
+
+
 class Config:
     def __init__(self, path: str, args: Namespace = None):
         with open(path, encoding="UTF-8") as f:
-            self._data = loadyaml(f, Loader=SafeLoader)
+            self._data = load_yaml(f)
             if self._data is None:
                 self._data = {}
         self._args = args
@@ -68,6 +74,37 @@ class Config:
             return join(d, "jellyfin.db")
         raise ValueError(_('%s not set.') % ('jellyfin_db'))
 
+    @cached_property
+    def read_only(self) -> bool:
+        if self._args and self._args.read_only:
+            return True
+        if 'read_only' in self._data and isinstance(self._data['read_only'], bool):  # noqa: E501
+            return self._data['read_only']
+        return False
+
+    @cached_property
+    def snapshot_dir(self) -> str | None:
+        if self._args and self._args.snapshot_dir:
+            return self._args.snapshot_dir
+        if 'snapshot_dir' in self._data and self._data['snapshot_dir']:
+            return self._data['snapshot_dir']
+
+    @cached_property
+    def unattended(self) -> bool:
+        if self._args and self._args.unattended:
+            return True
+        if 'unattended' in self._data and isinstance(self._data['unattended'], bool):  # noqa: E501
+            return self._data['unattended']
+        return False
+
+    @cached_property
+    def match_threshold(self) -> float:
+        if self._args and self._args.match_threshold is not None:
+            return self._args.match_threshold
+        if 'match_threshold' in self._data and isinstance(self._data['match_threshold'], (int, float)):  # noqa: E501
+            return self._data['match_threshold']
+        return 0.9
+
     @cached_property
     def output_dir(self) -> str:
         if self._args and self._args.output_dir:
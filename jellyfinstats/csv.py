@@ -1,90 +1,149 @@
 from enum import Enum
-from typing import IO, List
+from typing import IO, Iterable, Iterator, List, Optional
 
 
 UTF8_BOM = b'\xef\xbb\xbf'
+WRITE_BUFFER_ROWS = 4096
 
 
 def escapeField(s: str) -> str:
-    if s.find('\r\n') > -1 or s.find(',') > -1 or s.find('"') > -1:
+    if ',' in s or '"' in s or '\r\n' in s:
         return '"' + s.replace('"', '""') + '"'
     else:
         return s
 
 
-def readField(f: IO[str]) -> List[str]:
-    t = f.readline()
-    le = len(t)
-    if le == 0:
-        return None
-    i = 0
-    r = []
-    s = ''
-    e = False
-    a = False
-    while i < le:
-        n = t[i]
-        if n == '"' and s == '':
-            e = True
-        elif n == '"' and e:
-            e = False
-            a = True
-        elif n == '"' and a:
-            e = True
-            a = False
-            s += '"'
-        elif not e and n == ',':
-            r.append(s)
-            s = ''
-            a = False
-        else:
-            a = False
-            s += n
-        i += 1
-        if e and i == le:
-            t += f.readline()
-            le = len(t)
-    if s != '':
-        r.append(s)
-    if r[-1][-1] == '\n':
-        r[-1] = r[-1][:-1]
-    return r
+class CSVReader:
+    """Streaming reader for files written by :class:`CSVFile`.
+
+    Every character is looked at a constant number of times, so long
+    quoted fields spanning many lines are read in linear time. Rows end
+    with CRLF like :func:`formatRow` writes them; a lone LF is part of the
+    field."""
+    def __init__(self, f: IO[bytes]):
+        self._f = f
+
+    def __iter__(self) -> Iterator[List[str]]:
+        while True:
+            row = self.read_row()
+            if row is None:
+                return
+            yield row
+
+    def read_row(self) -> Optional[List[str]]:
+        row = []
+        parts = []
+        quoted = False
+        start = True
+        while True:
+            line = self._f.readline()
+            if not line:
+                if parts or row or not start:
+                    row.append(''.join(parts))
+                    return row
+                return None
+            t = line.decode()
+            if start and not row and '"' not in t and t.endswith('\r\n'):
+                return t[:-2].split(',')
+            pos = 0
+            while True:
+                if quoted:
+                    j = t.find('"', pos)
+                    if j == -1:
+                        parts.append(t[pos:])
+                        break
+                    if t.startswith('"', j + 1):
+                        parts.append(t[pos:j + 1])
+                        pos = j + 2
+                    else:
+                        parts.append(t[pos:j])
+                        pos = j + 1
+                        quoted = False
+                    continue
+                if start and t.startswith('"', pos):
+                    quoted = True
+                    start = False
+                    pos += 1
+                    continue
+                start = False
+                j = t.find(',', pos)
+                if j != -1:
+                    parts.append(t[pos:j])
+                    row.append(''.join(parts))
+                    parts = []
+                    start = True
+                    pos = j + 1
+                    continue
+                rest = t[pos:]
+                if not rest.endswith('\r\n'):
+                    # A lone LF, or the end of the file.
+                    parts.append(rest)
+                    break
+                parts.append(rest[:-2])
+                row.append(''.join(parts))
+                return row
+
+
+def readField(f: IO[bytes]) -> Optional[List[str]]:
+    return CSVReader(f).read_row()
+
+
+def formatField(i) -> str:
+    t = type(i)
+    if t is str:
+        return escapeField(i)
+    if t is int or t is float:
+        return str(i)
+    if i is None:
+        return ''
+    if isinstance(i, str):
+        return escapeField(i)
+    if isinstance(i, bool):
+        return str(int(i))
+    if isinstance(i, Enum):
+        return escapeField(str(i.value))
+    return escapeField(str(i))
+
+
+def formatRow(k) -> str:
+    return ','.join([formatField(i) for i in k]) + '\r\n'
 
 
 def writeField(f: IO[bytes], *k):
-    a = False
-    for i in k:
-        if a:
-            f.write(b',')
-        else:
-            a = True
-        if i is None:
-            i = ''
-        elif isinstance(i, bool):
-            i = str(int(i))
-        elif isinstance(i, Enum):
-            i = str(i.value)
-        elif not isinstance(i, str):
-            i = str(i)
-        f.write(escapeField(i).encode())
-    f.write(b'\r\n')
+    f.write(formatRow(k).encode())
+
+
+def writeRows(f: IO[bytes], rows: Iterable[Iterable]):
+    """Write many rows, encoding them in chunks of
+    ``WRITE_BUFFER_ROWS`` rows instead of one write per field."""
+    buf = []
+    for k in rows:
+        buf.append(formatRow(k))
+        if len(buf) >= WRITE_BUFFER_ROWS:
+            f.write(''.join(buf).encode())
+            buf.clear()
+    if buf:
+        f.write(''.join(buf).encode())
 
 
 class OpenMode(Enum):
     Read = 1
     Write = 2
+    Append = 3
 
 
 class CSVFile:
     def __init__(self, path: str, mode: OpenMode = OpenMode.Write):
-        mod = 'rb' if mode == OpenMode.Read else 'wb'
+        mod = 'rb' if mode == OpenMode.Read else 'ab' if mode == OpenMode.Append else 'wb'  # noqa: E501
         self._mode = mode
         self._f = open(path, mod)
+        self._reader = None
         if mode == OpenMode.Read:
             bom = self._f.read(3)
             if bom != UTF8_BOM:
                 self._f.seek(0)
-        else:
+            self._reader = CSVReader(self._f)
+        elif mode == OpenMode.Write or self._f.tell() == 0:
             self._f.write(UTF8_BOM)
         self._closed = False
 
@@ -94,6 +153,11 @@ class CSVFile:
     def __exit__(self, tp, val, trace):
         self.close()
 
+    def __iter__(self) -> Iterator[List[str]]:
+        if self._mode != OpenMode.Read:
+            raise ValueError("Stream is not readable")
+        return iter(self._reader)
+
     def close(self):
         if self._closed:
             return
@@ -103,9 +167,14 @@ class CSVFile:
     def read(self):
         if self._mode != OpenMode.Read:
             raise ValueError("Stream is not readable")
-        return readField(self._f)
+        return self._reader.read_row()
 
     def write(self, *k):
-        if self._mode != OpenMode.Write:
+        if self._mode == OpenMode.Read:
             raise ValueError("Stream is not writable")
         writeField(self._f, *k)
+
+    def write_rows(self, rows: Iterable[Iterable]):
+        if self._mode == OpenMode.Read:
+            raise ValueError("Stream is not writable")
+        writeRows(self._f, rows)
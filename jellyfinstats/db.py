@@ -1,12 +1,79 @@
 import sqlite3
-from .utils import convert_uid, format_time
+from os import makedirs
+from os.path import abspath, basename, join
+from typing import List, Tuple
+from urllib.parse import quote
+from . import _
+from .metrics import connection_factory
+from .utils import compact_uid, convert_uid, format_time
+
+
+READ_ONLY_PRAGMAS = (
+    'PRAGMA query_only = ON;',
+    'PRAGMA mmap_size = 268435456;',
+    'PRAGMA cache_size = -65536;',
+    'PRAGMA temp_store = MEMORY;',
+)
+
+
+# Integer sums, so the checksums of two ranges of rows add up exactly, and
+# max(DateCreated) last. Only built-in functions which do not copy strings
+# are used, as the whole table is read.
+ACTIVITY_CHECKSUM_TERMS = (
+    'count(*)',
+    'ifnull(sum(PlayDuration), 0)',
+    'ifnull(sum((ROWID % 65536) * PlayDuration), 0)',
+    'ifnull(sum((ROWID % 64 + 1) * (CAST((julianday(DateCreated) - 2440587.5) * 86400000 AS INTEGER) % 2147483647)), 0)',  # noqa: E501
+    "ifnull(sum((ROWID % 64 + 1) * (unicode(UserId) + 128 * unicode(ItemId) + 16384 * (instr(ItemId, '0') + 33 * instr(ItemId, 'a')))), 0)",  # noqa: E501
+    'max(DateCreated)',
+)
+
+
+def add_activity_checksums(a, b) -> tuple:
+    """Checksum of the rows of two disjoint ranges from their
+    :meth:`PlaybackReportingDb.get_activity_checksum`."""
+    maxDate = max((i for i in (a[-1], b[-1]) if i is not None), default=None)
+    return tuple(x + y for x, y in zip(a[:-1], b[:-1])) + (maxDate,)
+
+
+def connect(fn: str, readOnly: bool = False):
+    """Open a database. Read only connections use ``mode=ro`` and larger
+    page cache and mmap sizes, which suit long sequential scans."""
+    if readOnly:
+        db = sqlite3.connect(f'file:{quote(abspath(fn))}?mode=ro', uri=True,
+                             factory=connection_factory())
+        for pragma in READ_ONLY_PRAGMAS:
+            db.execute(pragma)
+        return db
+    return sqlite3.connect(fn, factory=connection_factory())
+
+
+def snapshot_db(fn: str, output_dir: str) -> str:
+    """Copy a consistent snapshot of a (possibly live) database into
+    ``output_dir`` with the online backup API and return its path."""
+    makedirs(output_dir, exist_ok=True)
+    path = join(output_dir, basename(fn))
+    if abspath(path) == abspath(fn):
+        raise ValueError(_("The snapshot would overwrite the database: %s") % (fn))  # noqa: E501
+    src = connect(fn, True)
+    try:
+        dst = sqlite3.connect(path)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+    finally:
+        src.close()
+    return path
 
 
 class PlaybackReportingDb:
-    def __init__(self, fn: str):
-        self._db = sqlite3.connect(fn)
+    def __init__(self, fn: str, readOnly: bool = False):
+        self.path = fn
+        self._db = connect(fn, readOnly)
         self._closed = False
         self._changed = False
+        self._durationKey = None
 
     def __enter__(self):
         return self
@@ -22,12 +89,10 @@ class PlaybackReportingDb:
         self._db.close()
         self._closed = True
 
-    def get_activitys(self, offset: int = 0, limit: int = 100,
-                      itemType: str = None, userId: str = None,
-                      startTime: float = None, endTime: float = None,
-                      clientName: str = None, deviceName: str = None):
+    def _activity_where(self, itemType: str = None, userId: str = None,
+                        startTime: float = None, endTime: float = None,
+                        clientName: str = None, deviceName: str = None):
         where_sqls = []
-        where_sql = ''
         args = []
         if itemType is not None:
             where_sqls.append('ItemType = ?')
@@ -39,7 +104,10 @@ class PlaybackReportingDb:
             where_sqls.append('DateCreated >= ?')
             args.append(format_time(startTime))
         if endTime is not None:
-            where_sqls.append('DateCreated <= ?')
+            # Exclusive: DateCreated has 7 fraction digits, format_time 6,
+            # so an inclusive bound would drop plays in its last
+            # microsecond.
+            where_sqls.append('DateCreated < ?')
             args.append(format_time(endTime))
         if clientName is not None:
             where_sqls.append("ClientName = ?")
@@ -47,6 +115,15 @@ class PlaybackReportingDb:
         if deviceName is not None:
             where_sqls.append("DeviceName = ?")
             args.append(deviceName)
+        return where_sqls, args
+
+    def get_activitys(self, offset: int = 0, limit: int = 100,
+                      itemType: str = None, userId: str = None,
+                      startTime: float = None, endTime: float = None,
+                      clientName: str = None, deviceName: str = None):
+        where_sqls, args = self._activity_where(
+            itemType, userId, startTime, endTime, clientName, deviceName)
+        where_sql = ''
         if len(where_sqls):
             where_sql = ' WHERE ' + " AND ".join(where_sqls)
         args.append(limit)
@@ -55,17 +132,149 @@ class PlaybackReportingDb:
         cur.row_factory = sqlite3.Row
         return [dict(i) for i in cur.fetchall()]
 
+    def iter_activitys(self, itemType: str = None, userId: str = None,
+                       startTime: float = None, endTime: float = None,
+                       clientName: str = None, deviceName: str = None,
+                       batchSize: int = 1000, afterRowId: int = None,
+                       maxRowId: int = None):
+        """Iterate activities in ROWID order."""
+        for page in self.iter_activity_pages(
+                itemType, userId, startTime, endTime, clientName, deviceName,
+                batchSize, afterRowId, maxRowId):
+            yield from page
+
+    def iter_activity_pages(self, itemType: str = None, userId: str = None,
+                            startTime: float = None, endTime: float = None,
+                            clientName: str = None, deviceName: str = None,
+                            batchSize: int = 1000, afterRowId: int = None,
+                            maxRowId: int = None, columns: List[str] = None,
+                            itemTypes: List[str] = None):
+        """Iterate lists of at most ``batchSize`` activities in ROWID order.
+
+        Only ``columns`` (and ``rowid``) are fetched if given, and only
+        activities of ``itemTypes``. Pages are fetched with
+        ``ROWID > last_rowid`` instead of ``OFFSET`` so every page is an
+        index seek on the rowid b-tree."""
+        where_sqls, args = self._activity_where(
+            itemType, userId, startTime, endTime, clientName, deviceName)
+        if itemTypes is not None:
+            where_sqls.append(f'ItemType IN ({", ".join("?" * len(itemTypes))})')  # noqa: E501
+            args.extend(itemTypes)
+        if maxRowId is not None:
+            where_sqls.insert(0, 'ROWID <= ?')
+            args.insert(0, maxRowId)
+        where_sqls.insert(0, 'ROWID > ?')
+        where_sql = ' WHERE ' + " AND ".join(where_sqls)
+        select = ', '.join(columns) if columns is not None else '*'
+        sql = f"SELECT ROWID, {select} FROM PlaybackActivity{where_sql} ORDER BY ROWID LIMIT ?;"  # noqa: E501
+        last = afterRowId if afterRowId is not None else -1
+        while True:
+            cur = self._db.execute(sql, [last] + args + [batchSize])
+            cur.row_factory = sqlite3.Row
+            data = cur.fetchall()
+            if not data:
+                break
+            yield [dict(i) for i in data]
+            last = data[-1]['rowid']
+            if len(data) < batchSize:
+                break
+
+    def load_item_durations(self, durations, key=None):
+        """Fill the temporary ``ItemDuration`` table read by
+        :meth:`iter_activity_groups` with ``(ItemId, Duration)`` pairs.
+        Loading the same ``key`` again is skipped."""
+        if key is not None and key == self._durationKey:
+            return
+        queryOnly = self._db.execute('PRAGMA query_only;').fetchone()[0]
+        # The temp database is writable on read only connections too.
+        self._db.execute('PRAGMA query_only = OFF;')
+        try:
+            with self._db:
+                self._db.execute("CREATE TEMP TABLE IF NOT EXISTS ItemDuration (ItemId TEXT PRIMARY KEY, Duration REAL NOT NULL);")  # noqa: E501
+                self._db.execute("DELETE FROM temp.ItemDuration;")
+                self._db.executemany("INSERT OR REPLACE INTO temp.ItemDuration VALUES (?, ?);", durations)  # noqa: E501
+        finally:
+            if queryOnly:
+                self._db.execute('PRAGMA query_only = ON;')
+        self._durationKey = key
+
+    def iter_activity_groups(self, itemType: str = None, userId: str = None,
+                             startTime: float = None, endTime: float = None):
+        """Iterate ``ItemId`` groups with their row count, play duration,
+        play count and first ROWID (as ``rowid``), ordered by the first
+        ROWID.
+
+        The play count of a row is computed from the ``ItemDuration`` of
+        :meth:`load_item_durations` like ``audio.get_play_count``; rows of
+        items without a duration count as one play."""
+        where_sqls, args = self._activity_where(
+            itemType, userId, startTime, endTime)
+        where_sql = ''
+        if len(where_sqls):
+            where_sql = ' WHERE ' + " AND ".join(where_sqls)
+        cur = self._db.execute(f"SELECT ItemId, count(*) AS count, sum(PlayDuration) AS PlayDuration, sum(CASE WHEN Duration IS NULL THEN 1 ELSE Plays + (PlayDuration - Duration * Plays > 60 OR PlayDuration - Duration * Plays > Duration * 0.95) END) AS PlayCount, min(rowid) AS rowid FROM (SELECT a.ItemId, a.PlayDuration, a.rowid, d.Duration, CAST(a.PlayDuration / d.Duration AS INTEGER) AS Plays FROM (SELECT ROWID AS rowid, ItemId, PlayDuration FROM PlaybackActivity{where_sql}) a LEFT JOIN temp.ItemDuration d ON d.ItemId = a.ItemId) GROUP BY ItemId ORDER BY rowid;", args)  # noqa: E501
+        cur.row_factory = sqlite3.Row
+        for i in cur:
+            yield dict(i)
+
+    def iter_activity_items(self, itemType: str = None):
+        """Iterate distinct ``ItemId`` values with the ``ItemName`` and ROWID
+        (as ``rowid``) of their first activity, ordered by that ROWID."""
+        where_sqls, args = self._activity_where(itemType)
+        where_sql = ''
+        if len(where_sqls):
+            where_sql = ' WHERE ' + " AND ".join(where_sqls)
+        # With min(), SQLite takes the bare columns from the row holding the
+        # minimum, i.e. the first activity of the item.
+        cur = self._db.execute(f"SELECT min(ROWID) AS rowid, ItemId, ItemName FROM PlaybackActivity{where_sql} GROUP BY ItemId ORDER BY rowid;", args)  # noqa: E501
+        cur.row_factory = sqlite3.Row
+        for i in cur:
+            yield dict(i)
+
+    def get_max_rowid(self) -> int:
+        cur = self._db.execute("SELECT max(ROWID) FROM PlaybackActivity;")
+        re = cur.fetchone()[0]
+        return re if re is not None else 0
+
+    def get_activity_checksum(self, itemType: str = None,
+                              maxRowId: int = None, afterRowId: int = None):
+        """Cheap fingerprint of activities in (``afterRowId``, ``maxRowId``],
+        used to detect rows changed (e.g. by ``--fix``), replaced or removed
+        afterwards.
+
+        Besides the play durations it sums the time of DateCreated and
+        characters of UserId and ItemId, weighted by ROWID. See
+        :func:`add_activity_checksums`."""
+        where_sqls, args = self._activity_where(itemType)
+        if afterRowId is not None:
+            where_sqls.append('ROWID > ?')
+            args.append(afterRowId)
+        if maxRowId is not None:
+            where_sqls.append('ROWID <= ?')
+            args.append(maxRowId)
+        where_sql = ''
+        if len(where_sqls):
+            where_sql = ' WHERE ' + " AND ".join(where_sqls)
+        cur = self._db.execute(f"SELECT {', '.join(ACTIVITY_CHECKSUM_TERMS)} FROM PlaybackActivity{where_sql};", args)  # noqa: E501
+        return tuple(cur.fetchone())
+
     def get_client_devices(self):
         cur = self._db.execute("SELECT ClientName, DeviceName FROM PlaybackActivity GROUP BY ClientName, DeviceName;")  # noqa: E501
         cur.row_factory = sqlite3.Row
         return [dict(i) for i in cur.fetchall()]
 
-    def get_users(self, itemType: str = None):
-        where_sql = ''
+    def get_users(self, itemType: str = None, userIds: List[str] = None):
+        """Users with the dates of their first and last activity. With
+        ``userIds``, only these users are grouped."""
+        where_sqls = []
         args = []
         if itemType is not None:
-            where_sql = ' WHERE ItemType = ?'
+            where_sqls.append('ItemType = ?')
             args.append(itemType)
+        if userIds is not None:
+            where_sqls.append(f'UserId IN ({", ".join("?" * len(userIds))})')  # noqa: E501
+            args.extend(userIds)
+        where_sql = ' WHERE ' + ' AND '.join(where_sqls) if where_sqls else ''  # noqa: E501
         cur = self._db.execute(f"SELECT UserId, min(DateCreated) AS MinDate, max(DateCreated) AS MaxDate FROM PlaybackActivity{where_sql} GROUP BY UserId;", args)  # noqa: E501
         cur.row_factory = sqlite3.Row
         return [dict(i) for i in cur.fetchall()]
@@ -74,11 +283,98 @@ class PlaybackReportingDb:
         self._db.execute("UPDATE PlaybackActivity SET PlayDuration = ? WHERE rowid = ?;", [duration, rowid])  # noqa: E501
         self._changed = True
 
+    def iter_next_plays(self, itemType: str = None):
+        """Iterate activities together with the time of the next play on
+        the same client and device.
+
+        Only rows whose play duration may exceed the gap to the next play
+        (checked with millisecond precision and one second of slack) are
+        returned; the exact check is up to the caller."""
+        where_sqls, args = self._activity_where(itemType)
+        where_sql = ''
+        if len(where_sqls):
+            where_sql = ' WHERE ' + " AND ".join(where_sqls)
+        cur = self._db.execute(f"SELECT * FROM (SELECT ROWID AS rowid, DateCreated, ClientName, DeviceName, PlayDuration, LEAD(DateCreated) OVER (PARTITION BY ClientName, DeviceName ORDER BY DateCreated, ROWID) AS NextDateCreated FROM PlaybackActivity{where_sql}) WHERE NextDateCreated IS NOT NULL AND ((julianday(NextDateCreated) - julianday(DateCreated)) * 86400.0 < PlayDuration OR julianday(NextDateCreated) IS NULL OR julianday(DateCreated) IS NULL);", args)  # noqa: E501
+        cur.row_factory = sqlite3.Row
+        for i in cur:
+            yield dict(i)
+
+    def update_playdurations(self, durations: List[Tuple[int, int]]):
+        """Update many ``(rowid, duration)`` pairs in one transaction."""
+        with self._db:
+            self._db.executemany("UPDATE PlaybackActivity SET PlayDuration = ? WHERE rowid = ?;", [(d, r) for r, d in durations])  # noqa: E501
+
+
+AUDIO_TYPE = 'MediaBrowser.Controller.Entities.Audio.Audio'
+MUSIC_ALBUM_TYPE = 'MediaBrowser.Controller.Entities.Audio.MusicAlbum'
+
+
+def add_to_index(index: dict, key, value):
+    if key in index:
+        index[key].append(value)
+    else:
+        index[key] = [value]
+
+
+ITEM_COLUMNS = ('type', 'Name', 'Album', 'Artists', 'AlbumArtists',
+                'RunTimeTicks', 'Genres', 'IndexNumber', 'ParentIndexNumber',
+                'ProductionYear', 'PremiereDate', 'Studios',
+                'PresentationUniqueKey')
+ITEM_SELECT = ', '.join(ITEM_COLUMNS)
+
+
+class LibraryItem:
+    """The columns of a ``TypedBaseItems`` row which are used by reports.
+
+    Values are read like a dict (``item['Name']``, ``'type' in item``)."""
+    __slots__ = ITEM_COLUMNS
+
+    def __init__(self, type, Name, Album, Artists, AlbumArtists,
+                 RunTimeTicks, Genres, IndexNumber, ParentIndexNumber,
+                 ProductionYear, PremiereDate, Studios,
+                 PresentationUniqueKey):
+        self.type = type
+        self.Name = Name
+        self.Album = Album
+        self.Artists = Artists
+        self.AlbumArtists = AlbumArtists
+        self.RunTimeTicks = RunTimeTicks
+        self.Genres = Genres
+        self.IndexNumber = IndexNumber
+        self.ParentIndexNumber = ParentIndexNumber
+        self.ProductionYear = ProductionYear
+        self.PremiereDate = PremiereDate
+        self.Studios = Studios
+        self.PresentationUniqueKey = PresentationUniqueKey
+
+    def __getitem__(self, key: str):
+        if key not in ITEM_COLUMNS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in ITEM_COLUMNS
+
+    def __repr__(self):
+        return f'LibraryItem({self.type!r}, {self.Name!r}, {self.PresentationUniqueKey!r})'  # noqa: E501
+
+
+def library_item_factory(cur, row) -> LibraryItem:
+    return LibraryItem(*row)
+
 
 class LibraryDb:
-    def __init__(self, fn: str):
-        self._db = sqlite3.connect(fn)
+    def __init__(self, fn: str, readOnly: bool = False):
+        self._db = connect(fn, readOnly)
         self._closed = False
+        self._audios = None
+        self._audiosByName = None
+        self._audiosByAlbum = None
+        self._audiosByNameAlbum = None
+        self._albums = None
+        self._albumsByName = None
+        self._albumsByNameArtists = None
+        self._items = {}
 
     def __enter__(self):
         return self
@@ -92,19 +388,83 @@ class LibraryDb:
         self._db.close()
         self._closed = True
 
+    def get_max_rowid(self) -> int:
+        cur = self._db.execute("SELECT max(ROWID) FROM TypedBaseItems;")
+        re = cur.fetchone()[0]
+        return re if re is not None else 0
+
     def get_items(self, offset: int = 0, limit: int = 100):
         cur = self._db.execute("SELECT * FROM TypedBaseItems LIMIT ? OFFSET ?;", [limit, offset])  # noqa: E501
         cur.row_factory = sqlite3.Row
         return [dict(i) for i in cur.fetchall()]
 
+    def preload_audios(self):
+        """Load all audio items into memory with one sequential read.
+
+        Afterwards :meth:`get_item` and :meth:`get_audios` are answered from
+        in-memory indexes instead of one query per call."""
+        cur = self._db.execute(f"SELECT {ITEM_SELECT} FROM TypedBaseItems WHERE type = ?;", [AUDIO_TYPE])  # noqa: E501
+        cur.row_factory = library_item_factory
+        audios = {}
+        byName = {}
+        byAlbum = {}
+        byNameAlbum = {}
+        for item in cur:
+            audios[item['PresentationUniqueKey']] = item
+            add_to_index(byName, item['Name'], item)
+            add_to_index(byAlbum, item['Album'], item)
+            add_to_index(byNameAlbum, (item['Name'], item['Album']), item)
+        self._audios = audios
+        self._audiosByName = byName
+        self._audiosByAlbum = byAlbum
+        self._audiosByNameAlbum = byNameAlbum
+
+    def preload_albums(self):
+        """Load all music albums into memory with one sequential read.
+
+        Afterwards :meth:`get_albums` is answered from in-memory indexes
+        instead of one query per call."""
+        cur = self._db.execute(f"SELECT {ITEM_SELECT} FROM TypedBaseItems WHERE type = ?;", [MUSIC_ALBUM_TYPE])  # noqa: E501
+        cur.row_factory = library_item_factory
+        albums = []
+        byName = {}
+        byNameArtists = {}
+        for item in cur:
+            albums.append(item)
+            add_to_index(byName, item['Name'], item)
+            add_to_index(byNameArtists, (item['Name'], item['AlbumArtists']), item)  # noqa: E501
+        self._albums = albums
+        self._albumsByName = byName
+        self._albumsByNameArtists = byNameArtists
+
     def get_item(self, itemId: str):
-        cur = self._db.execute("SELECT * FROM TypedBaseItems WHERE PresentationUniqueKey = ?;", [itemId])  # noqa: E501
-        cur.row_factory = sqlite3.Row
-        re = cur.fetchone()
-        return dict(re) if re is not None else None
+        if self._audios is not None:
+            if itemId in self._audios:
+                return self._audios[itemId]
+            if itemId in self._items:
+                return self._items[itemId]
+            item = self._get_item(itemId)
+            self._items[itemId] = item
+            return item
+        return self._get_item(itemId)
+
+    def _get_item(self, itemId: str):
+        cur = self._db.execute(f"SELECT {ITEM_SELECT} FROM TypedBaseItems WHERE PresentationUniqueKey = ?;", [itemId])  # noqa: E501
+        cur.row_factory = library_item_factory
+        return cur.fetchone()
 
     def get_audios(self, track: str = None, album: str = None):
-        args = ['MediaBrowser.Controller.Entities.Audio.Audio']
+        if self._audios is not None:
+            if track is not None and album is not None:
+                items = self._audiosByNameAlbum.get((track, album))
+            elif track is not None:
+                items = self._audiosByName.get(track)
+            elif album is not None:
+                items = self._audiosByAlbum.get(album)
+            else:
+                items = list(self._audios.values())
+            return list(items) if items else []
+        args = [AUDIO_TYPE]
         where_sql = ''
         if track is not None:
             where_sql += ' AND Name = ?'
@@ -112,12 +472,22 @@ class LibraryDb:
         if album is not None:
             where_sql += ' AND Album = ?'
             args.append(album)
-        cur = self._db.execute(f"SELECT * FROM TypedBaseItems WHERE type = ?{where_sql};", args)  # noqa: E501
-        cur.row_factory = sqlite3.Row
-        return [dict(i) for i in cur.fetchall()]
+        cur = self._db.execute(f"SELECT {ITEM_SELECT} FROM TypedBaseItems WHERE type = ?{where_sql};", args)  # noqa: E501
+        cur.row_factory = library_item_factory
+        return cur.fetchall()
 
     def get_albums(self, album: str = None, albumArtists: str = None):
-        args = ['MediaBrowser.Controller.Entities.Audio.MusicAlbum']
+        if self._albums is not None:
+            if album is not None and albumArtists is not None:
+                items = self._albumsByNameArtists.get((album, albumArtists))
+            elif album is not None:
+                items = self._albumsByName.get(album)
+            elif albumArtists is not None:
+                items = [i for i in self._albums if i['AlbumArtists'] == albumArtists]  # noqa: E501
+            else:
+                items = self._albums
+            return list(items) if items else []
+        args = [MUSIC_ALBUM_TYPE]
         where_sql = ''
         if album is not None:
             where_sql += ' AND Name = ?'
@@ -125,14 +495,14 @@ class LibraryDb:
         if albumArtists is not None:
             where_sql += ' AND AlbumArtists = ?'
             args.append(albumArtists)
-        cur = self._db.execute(f"SELECT * FROM TypedBaseItems WHERE type = ?{where_sql};", args)  # noqa: E501
-        cur.row_factory = sqlite3.Row
-        return [dict(i) for i in cur.fetchall()]
+        cur = self._db.execute(f"SELECT {ITEM_SELECT} FROM TypedBaseItems WHERE type = ?{where_sql};", args)  # noqa: E501
+        cur.row_factory = library_item_factory
+        return cur.fetchall()
 
 
 class JellyfinDb:
-    def __init__(self, fn: str):
-        self._db = sqlite3.connect(fn)
+    def __init__(self, fn: str, readOnly: bool = False):
+        self._db = connect(fn, readOnly)
         self._closed = False
 
     def __enter__(self):
@@ -154,3 +524,43 @@ class JellyfinDb:
         cur.row_factory = sqlite3.Row
         re = cur.fetchone()
         return dict(re) if re is not None else None
+
+    def get_users(self):
+        cur = self._db.execute("SELECT * FROM Users;")
+        cur.row_factory = sqlite3.Row
+        return [dict(i) for i in cur]
+
+
+class UserDirectory:
+    """All users of jellyfin.db read with one query.
+
+    Users are looked up by the user ids of playback_reporting.db like
+    with :meth:`JellyfinDb.get_user`."""
+    def __init__(self, jdb: JellyfinDb):
+        self._users = {u['Id']: u for u in jdb.get_users()}
+
+    def get_user(self, userId: str):
+        if len(userId) == 32:
+            userId = convert_uid(userId)
+        return self._users.get(userId)
+
+    def get_username(self, userId: str) -> str:
+        """The user name of ``userId``, or ``userId`` for unknown users."""
+        user = self.get_user(userId)
+        return user['Username'] if user else userId
+
+    def find_user_ids(self, names: List[str] = (),
+                      userIds: List[str] = ()) -> List[str]:
+        """Ids in playback_reporting.db of the users selected by ``names``
+        and ``userIds``.
+
+        Like the fallback of :meth:`get_username`, a name which is not a
+        known user's id also selects the unknown user with that id."""
+        re = set(userIds)
+        for u in self._users.values():
+            if u['Username'] in names:
+                re.add(compact_uid(u['Id']))
+        for name in names:
+            if self.get_user(name) is None:
+                re.add(name)
+        return sorted(re)
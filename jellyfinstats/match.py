@@ -0,0 +1,173 @@
+"""Unattended resolution of audio items which are no longer in the
+library."""
+from collections import Counter
+from difflib import SequenceMatcher
+from json import dump as dump_json, load as load_json
+from os import replace
+from os.path import exists
+from unicodedata import category, normalize as normalize_unicode
+from . import _
+from .db import add_to_index
+
+
+# Weights of track name, album and album artist in a match score.
+TRACK_WEIGHT = 0.6
+ALBUM_WEIGHT = 0.25
+ARTIST_WEIGHT = 0.15
+# The best candidate is only accepted if it beats the second best by this.
+AMBIGUITY_MARGIN = 0.05
+# Fuzzy candidates share at least this fraction of the trigrams of the track
+# name; only the ones sharing the most are kept.
+MIN_TRIGRAM_OVERLAP = 0.5
+MAX_FUZZY_CANDIDATES = 20
+
+
+def normalize(s: str | None) -> str:
+    """Fold case and width (NFKC) and replace punctuation and symbols with
+    spaces."""
+    if not s:
+        return ''
+    s = normalize_unicode('NFKC', s).casefold()
+    s = ''.join(' ' if category(c)[0] in 'PSZ' else c for c in s)
+    return ' '.join(s.split())
+
+
+def trigrams(s: str) -> set:
+    """Character trigrams of a normalized string, padded with spaces."""
+    if not s:
+        return set()
+    s = f'  {s} '
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+def similarity(a: str, b: str) -> float:
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+class AudioMatcher:
+    """Index of normalized track names, albums and artists of audio items,
+    with trigram posting lists of the track names for fuzzy lookups."""
+    def __init__(self, items):
+        self._items = []
+        self._byName = {}
+        self._byAlbum = {}
+        self._byArtist = {}
+        self._byTrigram = {}
+        for item in items:
+            index = len(self._items)
+            self._items.append(item)
+            name = normalize(item['Name'])
+            add_to_index(self._byName, name, item)
+            for gram in trigrams(name):
+                add_to_index(self._byTrigram, gram, index)
+            if item['Album']:
+                add_to_index(self._byAlbum, normalize(item['Album']), item)
+            names = '|'.join(i for i in (item['AlbumArtists'], item['Artists']) if i)  # noqa: E501
+            for artist in {normalize(i) for i in names.split('|')}:
+                if artist:
+                    add_to_index(self._byArtist, artist, item)
+
+    def fuzzy_candidates(self, name: str):
+        """Items whose normalized track names share the most trigrams with
+        ``name``."""
+        grams = trigrams(name)
+        counts = Counter()
+        for gram in grams:
+            counts.update(self._byTrigram.get(gram, ()))
+        minimum = len(grams) * MIN_TRIGRAM_OVERLAP
+        return [self._items[i] for i, n in counts.most_common(MAX_FUZZY_CANDIDATES) if n >= minimum]  # noqa: E501
+
+    def candidates(self, origin, items=()):
+        """Items with the same normalized track name, album or album artist
+        as ``origin`` or a similar track name, together with ``items``."""
+        re = {}
+        name = normalize(origin['track'])
+        found = [items, self._byName.get(name, ()),
+                 self.fuzzy_candidates(name)]
+        if origin['album']:
+            found.append(self._byAlbum.get(normalize(origin['album']), ()))
+        if origin['album_artist']:
+            artists = {normalize(origin['album_artist'])}
+            artists.update(normalize(i) for i in origin['album_artist'].split(','))  # noqa: E501
+            found.extend(self._byArtist.get(i, ()) for i in artists if i)
+        for i in found:
+            for item in i:
+                re.setdefault(item['PresentationUniqueKey'], item)
+        return list(re.values())
+
+    @staticmethod
+    def score(origin, item) -> float:
+        total = TRACK_WEIGHT * similarity(normalize(origin['track']),
+                                          normalize(item['Name']))
+        weight = TRACK_WEIGHT
+        if origin['album']:
+            total += ALBUM_WEIGHT * similarity(normalize(origin['album']),
+                                               normalize(item['Album']))
+            weight += ALBUM_WEIGHT
+        if origin['album_artist']:
+            artist = normalize(origin['album_artist'])
+            names = '|'.join(i for i in (item['AlbumArtists'], item['Artists']) if i)  # noqa: E501
+            total += ARTIST_WEIGHT * max([similarity(artist, normalize(i)) for i in names.split('|')] + [0.0])  # noqa: E501
+            weight += ARTIST_WEIGHT
+        return total / weight
+
+    def match(self, origin, threshold: float, items=()):
+        """Score the candidates of ``origin``.
+
+        Returns the accepted item (or None) and the candidates as
+        ``(score, item)`` sorted by score. An item is accepted if its score
+        is at least ``threshold`` and no other candidate comes close, or if
+        it is the only exact match after normalization."""
+        scored = [(self.score(origin, i), i) for i in self.candidates(origin, items)]  # noqa: E501
+        scored.sort(key=lambda x: (-x[0], x[1]['PresentationUniqueKey']))
+        if not scored or scored[0][0] < threshold:
+            return None, scored
+        if len(scored) > 1:
+            best, second = scored[0][0], scored[1][0]
+            if second == best or (best < 1.0 and best - second < AMBIGUITY_MARGIN):  # noqa: E501
+                return None, scored
+        return scored[0][1], scored
+
+
+class ReviewQueue:
+    """Missing items which could not be resolved unattended, kept in a JSON
+    file until they are reviewed with :class:`audio.AudioSelector`."""
+    def __init__(self, path: str):
+        self.path = path
+        self.items = {}
+        self._changed = False
+        if exists(path):
+            with open(path, 'r', encoding='UTF-8') as f:
+                data = load_json(f)
+            if data['version'] > 1:
+                t = _("Unsupported version: ")
+                raise NotImplementedError(f'{t}{data["version"]}')
+            self.items = data['items']
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, itemId: str, origin, scored):
+        self.items[itemId] = {
+            'original': origin,
+            'candidates': [{'id': i['PresentationUniqueKey'], 'score': round(s, 4)} for s, i in scored],  # noqa: E501
+        }
+        self._changed = True
+
+    def remove(self, itemId: str):
+        if self.items.pop(itemId, None) is not None:
+            self._changed = True
+
+    def save(self):
+        if not self._changed:
+            return
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='UTF-8') as f:
+            dump_json({'version': 1, 'items': self.items}, f,
+                      ensure_ascii=False, indent=2)
+        replace(tmp, self.path)
+        self._changed = False
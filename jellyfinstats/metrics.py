@@ -0,0 +1,192 @@
+import sqlite3
+from functools import wraps
+from json import dump as dump_json
+from time import perf_counter
+try:
+    from resource import getrusage, RUSAGE_SELF
+except ImportError:
+    getrusage = None
+
+
+def get_peak_memory() -> int | None:
+    """Peak resident set size of this process in bytes."""
+    if getrusage is None:
+        return None
+    from sys import platform
+    re = getrusage(RUSAGE_SELF).ru_maxrss
+    return re if platform == 'darwin' else re * 1024
+
+
+class Stage:
+    __slots__ = ('name', 'info', 'start', 'seconds', 'rows', 'queries',
+                 'query_time', 'peak_memory')
+
+    def __init__(self, name: str, info: dict):
+        self.name = name
+        self.info = info
+        self.start = perf_counter()
+        self.seconds = None
+        self.rows = 0
+        self.queries = 0
+        self.query_time = 0.0
+        self.peak_memory = None
+
+    def to_dict(self):
+        re = {'name': self.name}
+        re.update(self.info)
+        re['seconds'] = self.seconds
+        re['rows'] = self.rows
+        re['rows_per_second'] = self.rows / self.seconds if self.seconds else None  # noqa: E501
+        re['queries'] = self.queries
+        re['query_time'] = self.query_time
+        re['peak_memory'] = self.peak_memory
+        return re
+
+
+class _StageContext:
+    __slots__ = ('metrics', 'stage')
+
+    def __init__(self, metrics, stage: Stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.metrics._stack.append(self.stage)
+        return self.stage
+
+    def __exit__(self, tp, val, trace):
+        stage = self.stage
+        stage.seconds = perf_counter() - stage.start
+        stage.peak_memory = get_peak_memory()
+        self.metrics._stack.remove(stage)
+        self.metrics.stages.append(stage)
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, tp, val, trace):
+        pass
+
+
+NO_STAGE = _NoStage()
+
+
+class Metrics:
+    """Wall time, rows fetched from SQLite and query statistics per stage.
+
+    Disabled by default; :meth:`stage` then costs one attribute check."""
+    def __init__(self):
+        self.enabled = False
+        self.stages = []
+        self.rows = 0
+        self.queries = 0
+        self.query_time = 0.0
+        self._stack = []
+        self._start = perf_counter()
+
+    def enable(self):
+        self.enabled = True
+        self._start = perf_counter()
+
+    def stage(self, name: str, **info):
+        if not self.enabled:
+            return NO_STAGE
+        return _StageContext(self, Stage(name, info))
+
+    def add_query(self, t: float):
+        self.queries += 1
+        self.query_time += t
+        for stage in self._stack:
+            stage.queries += 1
+            stage.query_time += t
+
+    def add_fetch(self, t: float, rows: int):
+        self.rows += rows
+        self.query_time += t
+        for stage in self._stack:
+            stage.rows += rows
+            stage.query_time += t
+
+    def to_dict(self):
+        return {
+            'seconds': perf_counter() - self._start,
+            'rows': self.rows,
+            'queries': self.queries,
+            'query_time': self.query_time,
+            'peak_memory': get_peak_memory(),
+            'stages': [s.to_dict() for s in self.stages],
+        }
+
+    def dump(self, path: str):
+        with open(path, 'w', encoding='UTF-8') as f:
+            dump_json(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+
+metrics = Metrics()
+
+
+class TimedCursor(sqlite3.Cursor):
+    def fetchone(self):
+        t = perf_counter()
+        re = super().fetchone()
+        metrics.add_fetch(perf_counter() - t, 0 if re is None else 1)
+        return re
+
+    def fetchmany(self, *args, **kwargs):
+        t = perf_counter()
+        re = super().fetchmany(*args, **kwargs)
+        metrics.add_fetch(perf_counter() - t, len(re))
+        return re
+
+    def fetchall(self):
+        t = perf_counter()
+        re = super().fetchall()
+        metrics.add_fetch(perf_counter() - t, len(re))
+        return re
+
+    def __next__(self):
+        t = perf_counter()
+        try:
+            re = super().__next__()
+        except StopIteration:
+            metrics.add_fetch(perf_counter() - t, 0)
+            raise
+        metrics.add_fetch(perf_counter() - t, 1)
+        return re
+
+
+class TimedConnection(sqlite3.Connection):
+    def execute(self, sql, parameters=(), /):
+        cur = self.cursor(TimedCursor)
+        t = perf_counter()
+        cur.execute(sql, parameters)
+        metrics.add_query(perf_counter() - t)
+        return cur
+
+    def executemany(self, sql, parameters, /):
+        cur = self.cursor(TimedCursor)
+        t = perf_counter()
+        cur.executemany(sql, parameters)
+        metrics.add_query(perf_counter() - t)
+        return cur
+
+
+def connection_factory():
+    return TimedConnection if metrics.enabled else sqlite3.Connection
+
+
+def measure(name: str):
+    """Decorator which records every call of the function as a stage."""
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return f(*args, **kwargs)
+            with metrics.stage(name):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
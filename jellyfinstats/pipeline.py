@@ -0,0 +1,104 @@
+"""Bounded queues between threads, used to overlap database reads, Python
+aggregation and file writes."""
+from queue import Full, Queue
+from threading import Event, Thread
+
+
+QUEUE_SIZE = 8
+_END = object()
+
+
+class ThreadedReader:
+    """Iterate the items of ``produce()`` which is run in another thread.
+
+    At most ``maxsize`` items are buffered, so a slow consumer stops the
+    producer. Exceptions of the producer are raised in the consumer."""
+    def __init__(self, produce, maxsize: int = QUEUE_SIZE):
+        self._queue = Queue(maxsize)
+        self._stop = Event()
+        self._error = None
+        self._thread = Thread(target=self._run, args=(produce,), daemon=True)
+        self._thread.start()
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def _run(self, produce):
+        try:
+            for item in produce():
+                if not self._put(item):
+                    return
+        except BaseException as e:
+            self._error = e
+        self._put(_END)
+
+    def __iter__(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _END:
+                    break
+                yield item
+        finally:
+            self._stop.set()
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+
+class ThreadedWriter:
+    """Pass the items given to :meth:`put` to ``consume(iterable)`` which is
+    run in another thread.
+
+    :meth:`put` blocks while ``maxsize`` items are waiting. Exceptions of
+    the consumer are raised by :meth:`put` or :meth:`close`."""
+    def __init__(self, consume, maxsize: int = QUEUE_SIZE):
+        self._queue = Queue(maxsize)
+        self._error = None
+        self._ended = False
+        self._thread = Thread(target=self._run, args=(consume,), daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tp, val, trace):
+        if tp is None:
+            self.close()
+        else:
+            self._queue.put(_END)
+            self._thread.join()
+
+    def _items(self):
+        while not self._ended:
+            item = self._queue.get()
+            if item is _END:
+                self._ended = True
+                return
+            yield item
+
+    def _run(self, consume):
+        try:
+            consume(self._items())
+        except BaseException as e:
+            self._error = e
+        # Drain the queue so put() and close() never block.
+        for _i in self._items():
+            pass
+
+    def put(self, item):
+        if self._error is not None:
+            raise self._error
+        self._queue.put(item)
+
+    def close(self):
+        self._queue.put(_END)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
@@ -0,0 +1,74 @@
+"""Databases and caches of a command, opened when they are first used."""
+from contextlib import ExitStack
+from functools import cached_property
+from .cache import IdRelativeCache
+from .config import Config
+from .db import (
+    PlaybackReportingDb,
+    LibraryDb,
+    JellyfinDb,
+    UserDirectory,
+    snapshot_db,
+)
+
+
+class Resources:
+    """Open the databases and the id relative cache of ``cfg`` on first
+    access and close the opened ones on exit.
+
+    With ``cfg.snapshot_dir``, a database is copied there when it is first
+    used and the copy is opened read only."""
+    def __init__(self, cfg: Config):
+        self.cfg = cfg
+        self._stack = ExitStack()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tp, val, trace):
+        return self._stack.__exit__(tp, val, trace)
+
+    def _path(self, fn: str) -> str:
+        if self.cfg.snapshot_dir:
+            return snapshot_db(fn, self.cfg.snapshot_dir)
+        return fn
+
+    @cached_property
+    def read_only(self) -> bool:
+        return True if self.cfg.snapshot_dir else self.cfg.read_only
+
+    @cached_property
+    def playback_reporting_db(self) -> str:
+        """The path of the opened playback_reporting.db."""
+        return self._path(self.cfg.playback_reporting_db)
+
+    @cached_property
+    def library_db(self) -> str:
+        return self._path(self.cfg.library_db)
+
+    @cached_property
+    def jellyfin_db(self) -> str:
+        return self._path(self.cfg.jellyfin_db)
+
+    @cached_property
+    def pdb(self) -> PlaybackReportingDb:
+        return self._stack.enter_context(PlaybackReportingDb(
+            self.playback_reporting_db, self.read_only))
+
+    @cached_property
+    def ldb(self) -> LibraryDb:
+        return self._stack.enter_context(LibraryDb(self.library_db,
+                                                   self.read_only))
+
+    @cached_property
+    def jdb(self) -> JellyfinDb:
+        return self._stack.enter_context(JellyfinDb(self.jellyfin_db,
+                                                    self.read_only))
+
+    @cached_property
+    def icache(self) -> IdRelativeCache:
+        return self._stack.enter_context(IdRelativeCache(self.cfg.output_dir))  # noqa: E501
+
+    @cached_property
+    def users(self) -> UserDirectory:
+        return UserDirectory(self.jdb)
@@ -0,0 +1,264 @@
+"""Long running service which keeps the audio reports of all users in
+memory, follows new playback activities and answers queries over HTTP.
+
+Endpoints (all return JSON)::
+
+    GET /status
+    GET /users
+    GET /users/<user>
+    GET /users/<user>/<period>/<kind>?sort=play_count&limit=100
+
+``<user>`` is a user name or id, ``<period>`` is ``all``, a year
+(``2024``) or a month (``2024-05``) and ``<kind>`` is one of
+:data:`KINDS`."""
+from functools import cached_property
+from heapq import nlargest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps
+from os.path import join
+from threading import Lock, Thread
+from time import sleep, time
+from typing import List
+from urllib.parse import parse_qs, unquote, urlsplit
+from . import _
+from .aggregate import Aggregator, run_aggregators
+from .audio import (
+    REVIEW_QUEUE_FILE,
+    AudioRecord,
+    AudioReportSet,
+    add_audio_albums,
+    get_audio_info,
+    period_to_str,
+    resolve_audio_items,
+    str_to_period,
+)
+from .cache import IdRelativeCache
+from .config import Config
+from .db import PlaybackReportingDb, LibraryDb
+from .match import AudioMatcher, ReviewQueue
+from .utils import format_time
+
+
+POLL_INTERVAL = 5
+DEFAULT_LIMIT = 100
+KINDS = ('tracks', 'albums', 'artists', 'album_artists')
+SORT_KEYS = ('count', 'play_count', 'duration')
+
+
+class LiveAudioAggregator(Aggregator):
+    columns = ('DateCreated', 'UserId', 'ItemId', 'ItemName',
+               'PlaybackMethod', 'ClientName', 'DeviceName', 'PlayDuration')
+    itemTypes = ('Audio',)
+
+    def __init__(self, service: 'StatsService'):
+        self.service = service
+
+    def add(self, row):
+        self.service.add(row)
+
+
+class StatsService:
+    """In-memory audio reports updated with the activities above the last
+    seen ROWID.
+
+    Items which were not in the prepared maps are resolved unattended once
+    per update, outside of the lock held by queries. Only new rows are
+    followed: changes of old rows (e.g. by ``audio --fix``) and of the
+    library need a restart."""
+    def __init__(self, pdb: PlaybackReportingDb, ldb: LibraryDb,
+                 icache: IdRelativeCache, cfg: Config, maps, get_username,
+                 utc: bool = False, years: List[int] = None,
+                 users: List[str] = None):
+        self.pdb = pdb
+        self.ldb = ldb
+        self.icache = icache
+        self.cfg = cfg
+        self.itemMap, self.idMap, self.albumMap = maps
+        self.get_username = get_username
+        self.users = users if users else None
+        self.reports = AudioReportSet(utc, years, users, keepHistory=False)
+        self.names = {}
+        self.lastRowId = None
+        self.updated = None
+        self.plays = 0
+        self.pending = []
+        self.queue = ReviewQueue(join(cfg.output_dir, REVIEW_QUEUE_FILE))
+        self.lock = Lock()
+
+    @cached_property
+    def matcher(self) -> AudioMatcher:
+        return AudioMatcher(self.ldb.get_audios())
+
+    def add_user(self, userId: str) -> bool:
+        username = self.get_username(userId)
+        if self.users and username not in self.users and userId not in self.users:  # noqa: E501
+            return False
+        self.names[userId] = username
+        self.reports.add_user(userId)
+        return True
+
+    def add(self, row):
+        userId = row['UserId']
+        if userId not in self.names and not self.add_user(userId):
+            self.names[userId] = None
+        if self.names[userId] is None:
+            return
+        if row['ItemId'] not in self.idMap:
+            self.pending.append(row)
+            return
+        self.reports.add(userId, AudioRecord(row, self.itemMap, self.idMap))
+        self.plays += 1
+
+    def resolve_pending(self):
+        """Resolve the items of the pending rows which were not in the
+        maps."""
+        items = {}
+        for row in self.pending:
+            items.setdefault(row['ItemId'], row)
+        queued = len(self.queue)
+        resolve_audio_items(items.values(), self.ldb, self.icache, self.cfg,
+                            self.itemMap, self.idMap, True, self.matcher,
+                            self.queue)
+        add_audio_albums(self.ldb, self.itemMap, self.albumMap,
+                         {self.idMap[i] for i in items})
+        self.queue.save()
+        if len(self.queue) > queued:
+            print(_("%i missing items need review. Run audio --review to choose them.") % (len(self.queue)))  # noqa: E501
+
+    def update(self) -> int:
+        """Add the activities after the last seen ROWID. Returns the number
+        of new activities."""
+        maxRowId = self.pdb.get_max_rowid()
+        if maxRowId == self.lastRowId and not self.pending:
+            self.updated = time()
+            return 0
+        plays = self.plays
+        with self.lock:
+            run_aggregators(self.pdb, [LiveAudioAggregator(self)],
+                            self.lastRowId, maxRowId)
+            self.lastRowId = maxRowId
+        if self.pending:
+            # Kept for the next update if resolving fails.
+            self.resolve_pending()
+            with self.lock:
+                pending, self.pending = self.pending, []
+                for row in pending:
+                    self.add(row)
+        self.updated = time()
+        return self.plays - plays
+
+    def find_user(self, user: str):
+        if user in self.names and self.names[user] is not None:
+            return user
+        for userId in self.names:
+            if self.names[userId] == user:
+                return userId
+        return None
+
+    def format_entry(self, kind: str, key: str, count):
+        re = {'name': key}
+        if kind == 'tracks':
+            info = get_audio_info(self.itemMap[key])
+            re = {'id': key, 'name': info[0], 'artists': info[1],
+                  'album': info[2], 'album_artists': info[3]}
+        elif kind == 'albums':
+            album = self.albumMap.get(key)
+            if album is not None:
+                re['album_artists'] = album['AlbumArtists'] if 'type' in album else album['album_artists']  # noqa: E501
+        re['count'] = count['count']
+        re['play_count'] = count['play_count']
+        re['duration'] = count['duration']
+        return re
+
+    def query(self, parts: List[str], query):
+        """Answer a request for the path ``parts``. Returns the HTTP status
+        and the JSON data."""
+        with self.lock:
+            return self._query(parts, query)
+
+    def _query(self, parts: List[str], query):
+        if not parts or parts == ['status']:
+            return 200, {'last_rowid': self.lastRowId, 'plays': self.plays,
+                         'updated': format_time(self.updated) if self.updated else None}  # noqa: E501
+        if parts[0] != 'users' or len(parts) not in (1, 2, 4):
+            return 404, {'error': _("Not found.")}
+        if len(parts) == 1:
+            return 200, [{'id': u, 'name': self.names[u]} for u in self.reports.get_users()]  # noqa: E501
+        userId = self.find_user(parts[1])
+        if userId is None:
+            return 404, {'error': _("User not found.")}
+        if len(parts) == 2:
+            periods = self.reports.get_periods(userId)
+            return 200, {'id': userId, 'name': self.names[userId],
+                         'periods': [period_to_str(p) for p in periods]}
+        try:
+            period = str_to_period(parts[2])
+        except ValueError:
+            return 400, {'error': _("Invalid period.")}
+        kind = parts[3]
+        if kind not in KINDS:
+            return 404, {'error': _("Not found.")}
+        sort = query.get('sort', ['play_count'])[-1]
+        if sort not in SORT_KEYS:
+            return 400, {'error': _("Invalid sort key.")}
+        try:
+            limit = int(query.get('limit', [DEFAULT_LIMIT])[-1])
+        except ValueError:
+            return 400, {'error': _("Invalid limit.")}
+        report = self.reports.get_report(userId, period)
+        if report is None:
+            return 404, {'error': _("Report not found.")}
+        countMap = {'tracks': report.trackCountMap,
+                    'albums': report.albumCountMap,
+                    'artists': report.artistCountMap,
+                    'album_artists': report.alArtCountMap}[kind]
+        items = countMap.items()
+        if limit > 0:
+            items = nlargest(limit, items, key=lambda i: i[1][sort])
+        else:
+            items = sorted(items, key=lambda i: i[1][sort], reverse=True)
+        return 200, [self.format_entry(kind, k, c) for k, c in items]
+
+
+class StatsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [unquote(p) for p in url.path.split('/') if p]
+        status, data = self.server.service.query(parts, parse_qs(url.query))
+        body = dumps(data, ensure_ascii=False).encode('UTF-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(service: StatsService, host: str, port: int,
+          interval: float = POLL_INTERVAL):
+    """Load all activities, then answer requests in a server thread and
+    poll for new activities every ``interval`` seconds until interrupted.
+
+    Polling stays in the calling thread, which owns the database
+    connections."""
+    service.update()
+    server = ThreadingHTTPServer((host, port), StatsRequestHandler)
+    server.service = service
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print(_("Serving on http://%s:%i/") % server.server_address[:2])
+    try:
+        while True:
+            sleep(interval)
+            try:
+                service.update()
+            except Exception:
+                from traceback import print_exc
+                print_exc()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -1,6 +1,6 @@
 from math import ceil, floor
 from collections import namedtuple
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
 from re import compile
 from typing import Tuple
 from . import _
@@ -86,8 +86,33 @@ def parse_datetime(time: str) -> datetime:
     return datetime(int(re[1]), int(re[2]), int(re[3]), int(re[4]), int(re[5]), int(re[6]), int(re[7].ljust(6, '0')), timezone.utc)  # noqa: E501
 
 
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_day_seconds = {}
+_local_blocks = {}
+LOCAL_BLOCK = 900
+
+
+def parse_time_us(time: str) -> int:
+    """Parse a ``DateCreated`` value (UTC) into microseconds since epoch.
+
+    The usual ``YYYY-MM-DD HH:MM:SS.fffffff`` layout is parsed by slicing,
+    with seconds per day cached; anything else goes through
+    :func:`parse_datetime`."""
+    frac = time[20:26]
+    if len(time) >= 20 and time[10] == ' ' and time[13] == ':' and time[16] == ':' and (frac.isdigit() or not frac):  # noqa: E501
+        day = time[:10]
+        secs = _day_seconds.get(day)
+        if secs is None:
+            secs = (date(int(time[:4]), int(time[5:7]), int(time[8:10])).toordinal() - EPOCH_ORDINAL) * 86400  # noqa: E501
+            _day_seconds[day] = secs
+        secs += int(time[11:13]) * 3600 + int(time[14:16]) * 60 + int(time[17:19])  # noqa: E501
+        return secs * 1_000_000 + int(frac.ljust(6, '0'))
+    d = parse_datetime(time) - datetime(1970, 1, 1, tzinfo=timezone.utc)
+    return (d.days * 86400 + d.seconds) * 1_000_000 + d.microseconds
+
+
 def parse_time(time: str) -> float:
-    return parse_datetime(time).timestamp()
+    return parse_time_us(time) / 1_000_000
 
 
 def convert_uid(uid: str) -> str:
@@ -95,6 +120,12 @@ def convert_uid(uid: str) -> str:
     return f"{t[:8]}-{t[8:12]}-{t[12:16]}-{t[16:20]}-{t[20:]}"
 
 
+def compact_uid(uid: str) -> str:
+    """Inverse of :func:`convert_uid`: the user id format of
+    playback_reporting.db."""
+    return uid.replace('-', '').lower()
+
+
 def format_duration(duration: float | None) -> str:
     if duration is None:
         return ''
@@ -111,9 +142,38 @@ def format_duration(duration: float | None) -> str:
     return f"{re}{min}:{sec}"
 
 
+def format_local_time(us: int) -> Tuple[str, str]:
+    """Format microseconds since epoch as local ``%Y-%m-%d`` and
+    ``%H:%M:%S.%f``.
+
+    Local date and hour are computed once per 15 minute block, which only
+    holds if the UTC offset does not change inside the block; other blocks
+    are formatted with :func:`datetime.fromtimestamp`."""
+    sec, frac = divmod(us, 1_000_000)
+    block = sec // LOCAL_BLOCK
+    c = _local_blocks.get(block)
+    if c is None:
+        start = datetime.fromtimestamp(block * LOCAL_BLOCK)
+        end = datetime.fromtimestamp(block * LOCAL_BLOCK + LOCAL_BLOCK - 1)
+        if start.second == 0 and start.minute % 15 == 0 and (end - start).total_seconds() == LOCAL_BLOCK - 1:  # noqa: E501
+            c = (start.strftime("%Y-%m-%d"), start.strftime("%H"),
+                 start.minute)
+        else:
+            c = False
+        if len(_local_blocks) >= 100_000:
+            _local_blocks.clear()
+        _local_blocks[block] = c
+    if c is False:
+        d = datetime.fromtimestamp(sec).replace(microsecond=frac)
+        return d.strftime("%Y-%m-%d"), d.strftime("%H:%M:%S.%f")
+    rem = sec - block * LOCAL_BLOCK
+    return c[0], f'{c[1]}:{c[2] + rem // 60:02}:{rem % 60:02}.{frac:06}'
+
+
 def gen_year_range(year: int, utc: bool = False) -> Tuple[float, float]:
+    """Start of ``year`` and start of the next year (exclusive end)."""
     tz = timezone.utc if utc else None
-    return (datetime(year, 1, 1, tzinfo=tz).timestamp(), datetime(year, 12, 31, 23, 59, 59, 999999, tz).timestamp())  # noqa: E501
+    return (datetime(year, 1, 1, tzinfo=tz).timestamp(), datetime(year + 1, 1, 1, tzinfo=tz).timestamp())  # noqa: E501
 
 
 YearMonth = namedtuple('YearMonth', ['year', 'month'])
@@ -133,6 +193,7 @@ def parse_year_month(time: str) -> YearMonth:
 
 def gen_month_range(month: YearMonth,
                     utc: bool = False) -> Tuple[float, float]:
+    """Start of ``month`` and start of the next month (exclusive end)."""
     tz = timezone.utc if utc else None
     n = month + 1
-    return (datetime(month.year, month.month, 1, tzinfo=tz).timestamp(), datetime(n.year, n.month, 1, tzinfo=tz).timestamp() - 1e-6)  # noqa: E501
+    return (datetime(month.year, month.month, 1, tzinfo=tz).timestamp(), datetime(n.year, n.month, 1, tzinfo=tz).timestamp())  # noqa: E501
@@ -0,0 +1,37 @@
+from os.path import join
+from random import Random
+from tempfile import TemporaryDirectory
+from unittest import TestCase, main
+from jellyfinstats.csv import CSVFile, OpenMode
+
+
+def round_trip(rows):
+    with TemporaryDirectory() as d:
+        path = join(d, 'test.csv')
+        with CSVFile(path) as f:
+            f.write_rows(rows)
+        with CSVFile(path, OpenMode.Read) as f:
+            return list(f)
+
+
+class CSVFileTest(TestCase):
+    def test_lf_in_first_row(self):
+        rows = [['a\nb', 'c'], ['d', 'e\nf\n'], ['g\r', '\nh']]
+        self.assertEqual(round_trip(rows), rows)
+
+    def test_quoted(self):
+        rows = [['a,b', '"c"', 'd\r\ne'], ['', 'f']]
+        self.assertEqual(round_trip(rows), rows)
+
+    def test_random(self):
+        r = Random(0)
+        chars = 'ab,"\r\n é'
+        for _ in range(500):
+            rows = [[''.join(r.choice(chars) for _ in range(r.randrange(6)))
+                     for _ in range(r.randrange(1, 4))]
+                    for _ in range(r.randrange(1, 4))]
+            self.assertEqual(round_trip(rows), rows)
+
+
+if __name__ == '__main__':
+    main()